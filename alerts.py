@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from itertools import product
+
+from locations import normalize_arabic, strip_article, expand_location
+
+# ==============================
+# 🔔 فهرس عكسي لعمليات البحث المحفوظة
+# ==============================
+#
+# بدلاً من تجربة كل بحث محفوظ على الوظيفة الجديدة، يُسجل كل بحث تحت مفتاح واحد
+# (كلمة مفتاحية، التخصص، النوع، الموقع) - أي منها قد يكون None. الوظيفة الجديدة
+# تولد كل المفاتيح الممكنة لها فنحصل مباشرة على البحوث المرشحة، ثم نتحقق فقط من
+# باقي الكلمات المفتاحية.
+
+MAX_DIGEST_JOBS = 20
+
+
+def tokenize(text):
+    # "المحاسب" و"محاسب" كلمة واحدة
+    return {strip_article(word) or word for word in normalize_arabic(text).split()}
+
+
+class SavedSearchIndex:
+
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._searches = {}
+        self._keyword_counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self.loaded_max_id = 0
+
+    def __len__(self):
+        return len(self._searches)
+
+    def add(self, search):
+        """search: صف من saved_searches (id, category, job_type, location, location_id, keywords)"""
+        keywords = tokenize(search['keywords'])
+        # الكلمة الأقل استخداماً كمفتاح تُبقي قوائم المرشحين قصيرة
+        anchor = min(keywords, key=lambda k: (self._keyword_counts[k], -len(k))) if keywords else None
+        locations = expand_location(search['location_id']) or [None]
+        # موقع غير موجود في الدليل: يُسجل بدون موقع ويُقارن نصه بموقع الوظيفة عند المطابقة
+        location_text = normalize_arabic(search['location']) if not search['location_id'] else ''
+
+        keys = [(anchor, search['category'] or None, search['job_type'] or None, location_id)
+                for location_id in locations]
+        with self._lock:
+            for key in keys:
+                self._postings[key].add(search['id'])
+            if anchor:
+                self._keyword_counts[anchor] += 1
+            self._searches[search['id']] = (keys, frozenset(keywords - {anchor}), location_text)
+            self.loaded_max_id = max(self.loaded_max_id, search['id'])
+
+    def remove(self, search_id):
+        with self._lock:
+            entry = self._searches.pop(search_id, None)
+            if not entry:
+                return
+            keys = entry[0]
+            for key in keys:
+                self._postings[key].discard(search_id)
+                if not self._postings[key]:
+                    del self._postings[key]
+            if keys[0][0]:
+                self._keyword_counts[keys[0][0]] -= 1
+
+    def match(self, job):
+        """معرفات البحوث المحفوظة المطابقة لوظيفة
+        (title, description, requirements, category, job_type, location_id, location_text)"""
+        tokens = tokenize(' '.join(filter(None, [job['title'], job['description'], job['requirements']])))
+        job_location = normalize_arabic(job['location_text'])
+        postings = self._postings
+
+        # فقط الكلمات المستخدمة كمفاتيح في بحث ما
+        keyword_counts = self._keyword_counts
+        anchors = [token for token in tokens if keyword_counts.get(token)]
+
+        candidates = set()
+        for key in product([None, *anchors],
+                           {None, job['category'] or None},
+                           {None, job['job_type'] or None},
+                           {None, job['location_id']}):
+            ids = postings.get(key)
+            if ids:
+                candidates |= ids
+
+        searches = self._searches
+        return [search_id for search_id in candidates
+                if search_id in searches and searches[search_id][1] <= tokens
+                and searches[search_id][2] in job_location]
+
+
+def refresh_index(conn, index):
+    """تحميل البحوث المحفوظة الجديدة فقط (من عمليات أخرى أو منذ آخر تحميل)"""
+    rows = conn.execute('''SELECT id, category, job_type, location, location_id, keywords
+                           FROM saved_searches WHERE id > ? AND is_active = 1 ORDER BY id''',
+                        (index.loaded_max_id,)).fetchall()
+    for row in rows:
+        index.add(row)
+    return len(rows)
+
+
+def match_new_jobs(conn, index, job_ids):
+    """مطابقة وظائف جديدة (إضافة فردية أو استيراد جماعي) وتسجيلها بانتظار الملخص - بدون commit"""
+    refresh_index(conn, index)
+    if not job_ids or not len(index):
+        return 0
+
+    placeholders = ','.join('?' * len(job_ids))
+    # نص الموقع (الوظيفة + الشركة) للبحوث بمواقع خارج الدليل، كما في بحث /jobs
+    jobs_rows = conn.execute(f'''SELECT j.id, j.title, j.description, j.requirements, j.category, j.job_type, 
+                                        j.location_id, COALESCE(j.location, '') || ' ' || COALESCE(c.location, '') AS location_text
+                                 FROM jobs j JOIN companies c ON j.company_id = c.id 
+                                 WHERE j.id IN ({placeholders}) AND j.is_active = 1''',
+                             list(job_ids)).fetchall()
+
+    matches = []
+    for job in jobs_rows:
+        matches.extend((search_id, job['id']) for search_id in index.match(job))
+    if not matches:
+        return 0
+
+    # بحوث ألغيت من عملية أخرى تبقى في الفهرس المحلي فنستبعدها هنا
+    search_ids = sorted({search_id for search_id, _ in matches})
+    placeholders = ','.join('?' * len(search_ids))
+    active = {row['id'] for row in conn.execute(
+        f'SELECT id FROM saved_searches WHERE is_active = 1 AND id IN ({placeholders})', search_ids)}
+    for search_id in set(search_ids) - active:
+        index.remove(search_id)
+
+    matches = [m for m in matches if m[0] in active]
+    conn.executemany('INSERT OR IGNORE INTO alert_matches (saved_search_id, job_id) VALUES (?, ?)', matches)
+    return len(matches)
+
+
+# ==============================
+# 📮 صندوق الإرسال (قابل للاستبدال)
+# ==============================
+#
+# أي صندوق يوفر send(channel, recipient, subject, body). محلياً نكتب الرسائل في
+# جدول أو ملف، وفي الإنتاج يمكن إضافة صندوق بريد إلكتروني أو إشعارات بنفس الواجهة.
+
+class SQLiteOutbox:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send(self, channel, recipient, subject, body):
+        self.conn.execute('''INSERT INTO alert_outbox (channel, recipient, subject, body)
+                             VALUES (?, ?, ?, ?)''', (channel, recipient, subject, body))
+
+
+class FileOutbox:
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, channel, recipient, subject, body):
+        message = {'channel': channel, 'recipient': recipient, 'subject': subject,
+                   'body': body, 'created_at': datetime.now().isoformat(timespec='seconds')}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(message, ensure_ascii=False) + '\n')
+
+
+def get_outbox(name, conn, file_path=None):
+    if name == 'file':
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return FileOutbox(file_path)
+    return SQLiteOutbox(conn)
+
+
+def send_confirmation(outbox, email, confirm_url, unsubscribe_url):
+    """رسالة تأكيد البريد قبل تفعيل البحث المحفوظ"""
+    body = '\n'.join([
+        'طلب أحدهم تنبيهات وظائف على هذا البريد.',
+        f'لتفعيل التنبيه: {confirm_url}',
+        '',
+        f'إذا لم تطلب ذلك تجاهل الرسالة أو ألغه: {unsubscribe_url}',
+    ])
+    outbox.send('email', email, 'تأكيد تنبيه الوظائف', body)
+
+
+def send_digests(conn, outbox, base_url=''):
+    """تجميع المطابقات المعلقة في رسالة واحدة لكل بريد - يعيد عدد الرسائل"""
+    max_id = conn.execute('SELECT MAX(id) FROM alert_matches').fetchone()[0] or 0
+    rows = conn.execute('''
+        SELECT m.id, s.email, s.token, j.id as job_id, j.title, j.location, c.name as company_name
+        FROM alert_matches m
+        JOIN saved_searches s ON m.saved_search_id = s.id
+        JOIN jobs j ON m.job_id = j.id
+        JOIN companies c ON j.company_id = c.id
+        WHERE m.digested_at IS NULL AND m.id <= ? AND s.is_active = 1 AND j.is_active = 1
+        ORDER BY s.email, m.id
+    ''', (max_id,)).fetchall()
+
+    by_email = defaultdict(list)
+    for row in rows:
+        by_email[row['email']].append(row)
+
+    for email, items in by_email.items():
+        # نفس الوظيفة قد تطابق أكثر من بحث لنفس الشخص
+        jobs_seen = {}
+        for row in items:
+            jobs_seen.setdefault(row['job_id'], row)
+        jobs_list = list(jobs_seen.values())
+
+        lines = [f"- {row['title']} | {row['company_name']} | {row['location'] or ''}\n"
+                 f"  {base_url}/job/{row['job_id']}" for row in jobs_list[:MAX_DIGEST_JOBS]]
+        if len(jobs_list) > MAX_DIGEST_JOBS:
+            lines.append(f'... و{len(jobs_list) - MAX_DIGEST_JOBS} وظيفة أخرى')
+        tokens = sorted({row['token'] for row in items})
+        lines.append('')
+        lines.extend(f'لإلغاء التنبيه: {base_url}/alerts/{token}/delete' for token in tokens)
+
+        outbox.send('email', email, f'{len(jobs_list)} وظيفة جديدة تطابق بحثك', '\n'.join(lines))
+
+    # المطابقات لوظائف أو بحوث لم تعد نشطة تُغلق أيضاً
+    conn.execute("UPDATE alert_matches SET digested_at = datetime('now') WHERE digested_at IS NULL AND id <= ?",
+                 (max_id,))
+    conn.commit()
+    return len(by_email)
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# ==============================
+# 📊 عدادات المشاهدات والتقديم (مخزنة مؤقتاً في الذاكرة)
+# ==============================
+#
+# كل عملية (worker) تجمع الأحداث في الذاكرة وتكتبها دفعة واحدة كل فترة في جدول
+# job_stats مقسم بالساعات، بدلاً من تحويل كل قراءة لصفحة وظيفة إلى كتابة. عند توقف
+# العملية فجأة نفقد على الأكثر أحداث فترة واحدة.
+
+EVENTS = ('view', 'apply_click', 'apply_success')
+
+
+def hour_bucket(now=None):
+    return (now or datetime.now()).strftime('%Y-%m-%d %H:00')
+
+
+class EventCounter:
+
+    def __init__(self, connect, interval=30):
+        self._connect = connect
+        self._interval = interval
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    def record(self, job_id, event):
+        if event not in EVENTS or not job_id:
+            return
+        with self._lock:
+            self._counts[(job_id, event, hour_bucket())] += 1
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        # الخيط يبدأ عند أول حدث داخل العملية نفسها (بعد fork في gunicorn)
+        if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='stats-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            self.flush()
+
+    def flush(self):
+        """كتابة كل العدادات المعلقة في معاملة واحدة - يعيد عدد الصفوف"""
+        with self._lock:
+            pending, self._counts = self._counts, Counter()
+        if not pending:
+            return 0
+
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany('''
+                        INSERT INTO job_stats (job_id, event, bucket, count) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (job_id, event, bucket) DO UPDATE SET count = count + excluded.count
+                    ''', [(job_id, event, bucket, count) for (job_id, event, bucket), count in pending.items()])
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # قاعدة البيانات مشغولة: نعيد العدادات لتُكتب في المرة القادمة
+            with self._lock:
+                self._counts.update(pending)
+            return 0
+        return len(pending)
+
+
+def job_funnels(conn, company_id, job_id=None, days=30):
+    """أرقام المشاهدات والتقديم لوظائف الشركة خلال آخر أيام - {job_id: {event: count}}"""
+    query = '''
+        SELECT s.job_id, s.event, SUM(s.count) AS total
+        FROM job_stats s
+        JOIN jobs j ON s.job_id = j.id
+        WHERE j.company_id = ? AND s.bucket >= strftime('%Y-%m-%d %H:00', 'now', 'localtime', ?)
+    '''
+    params = [company_id, f'-{int(days)} days']
+    if job_id is not None:
+        query += ' AND s.job_id = ?'
+        params.append(job_id)
+    query += ' GROUP BY s.job_id, s.event'
+
+    funnels = {}
+    for row in conn.execute(query, params):
+        funnels.setdefault(row['job_id'], dict.fromkeys(EVENTS, 0))[row['event']] = row['total']
+    return funnels
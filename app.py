@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template, redirect, url_for, session, flash
+from flask import Flask, request, jsonify, send_from_directory, render_template, redirect, url_for, session, flash, Response, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -8,6 +8,31 @@ import sqlite3
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import re
+import csv
+import io
+import zipfile
+import hashlib
+from PIL import Image, ImageOps, UnidentifiedImageError
+import json
+from locations import LOCATIONS, resolve_location, expand_location, locations_list
+from salary import parse_salary, CURRENCIES, DEFAULT_CURRENCY
+import secrets
+import gzip
+import time
+import atexit
+import click
+import alerts
+import analytics
+import events
+import storage
+import suggest
+from contextlib import closing
+from queue import Empty
+
+try:
+    import msgpack
+except ImportError:  # صيغة MessagePack لواجهة المزامنة (في requirements.txt - بدونها تعيد 406)
+    msgpack = None
 
 app = Flask(__name__)
 
@@ -20,19 +45,66 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
 CV_FOLDER = os.path.join(UPLOAD_FOLDER, 'cvs')
 VIDEO_FOLDER = os.path.join(UPLOAD_FOLDER, 'videos')
+COMPANY_LOGOS = os.path.join(UPLOAD_FOLDER, 'logos')
 
 # إنشاء المجلدات إذا لم تكن موجودة
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CV_FOLDER, exist_ok=True)
 os.makedirs(VIDEO_FOLDER, exist_ok=True)
+os.makedirs(COMPANY_LOGOS, exist_ok=True)
 
 # قيود الحجم (بايت)
 MAX_CV_SIZE = 5 * 1024 * 1024  # 5MB
 MAX_VIDEO_SIZE = 60 * 1024 * 1024  # 60MB
+MAX_LOGO_SIZE = 2 * 1024 * 1024  # 2MB
 
 # الامتدادات المسموحة
 ALLOWED_CV = {'pdf', 'doc', 'docx'}
 ALLOWED_VIDEO = {'mp4', 'avi', 'mov', 'mkv'}
+ALLOWED_IMAGES = {'png', 'jpg', 'jpeg', 'gif'}
+
+# مقاسات شعارات الشركات (بكسل) - المصغر للقوائم والمتوسط لصفحة التفاصيل
+LOGO_VARIANTS = {'thumb': 96, 'medium': 256}
+LOGO_FORMATS = {'webp': 'WEBP', 'png': 'PNG'}
+LOGO_MAX_PIXELS = 4096 * 4096
+LOGO_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+# مراحل فرز المتقدمين (بالترتيب)
+APPLICANT_STATUSES = ['جديد', 'تم المراجعة', 'مقبول', 'مرفوض']
+
+# مدة الاحتفاظ بمفاتيح Idempotency-Key (ساعات)
+IDEMPOTENCY_TTL_HOURS = 24
+# مدة حجز المفتاح أثناء معالجة الطلب الأصلي (إذا توقفت العملية قبل إكماله)
+IDEMPOTENCY_LOCK_MINUTES = 10
+
+# مهلة إرسال مفتاح الرفع المباشر إلى /api/upload قبل اعتبار الملف مهملاً (ساعات)
+DIRECT_UPLOAD_CLAIM_HOURS = 2
+
+# بث أحداث لوحة التحكم (SSE): الفحص، نبضة الإبقاء، مدة الاتصال، مدة الاحتفاظ
+EVENTS_POLL_SECONDS = 2
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_STREAM_SECONDS = 300
+EVENTS_RETENTION_DAYS = 7
+
+# مزامنة الوظائف مع التطبيق: حجم الدفعة ومدة الاحتفاظ بسجلات الحذف
+SYNC_PAGE_SIZE = 500
+SYNC_TOMBSTONE_DAYS = 30
+
+# الفترة بين كتابة عدادات المشاهدات والتقديم (ثوانٍ)
+STATS_FLUSH_SECONDS = 30
+
+# الإكمال التلقائي: أقصى فترة قبل ملاحظة وظائف أضيفت من عملية أخرى (ثوانٍ)، وعدد الاقتراحات
+SUGGEST_REFRESH_SECONDS = 5
+SUGGEST_LIMIT = 8
+
+# حجم القطعة عند بث الملفات
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# الحد الأقصى لعدد المتقدمين في تحديث جماعي واحد
+MAX_BULK_APPLICANTS = 1000
+
+# نطاق الأعداد الصحيحة في SQLite (الأكبر منه يرفع OverflowError عند الربط)
+SQLITE_INT_MIN, SQLITE_INT_MAX = -2**63, 2**63 - 1
 
 # قاعدة البيانات
 DATABASE = os.path.join(BASE_DIR, 'بوابتي_للتوظيف.db')
@@ -42,8 +114,12 @@ app.config['SECRET_KEY'] = 'بوابتي-للتوظيف-اليمن-2024-سر-آ
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['CV_FOLDER'] = CV_FOLDER
 app.config['VIDEO_FOLDER'] = VIDEO_FOLDER
+app.config['COMPANY_LOGOS'] = COMPANY_LOGOS
 app.config['MAX_CONTENT_LENGTH'] = MAX_VIDEO_SIZE + MAX_CV_SIZE
 app.config['DATABASE'] = DATABASE
+app.config['ALERT_OUTBOX'] = os.environ.get('ALERT_OUTBOX', 'sqlite')  # sqlite | file
+app.config['ALERT_OUTBOX_FILE'] = os.path.join(BASE_DIR, 'outbox', 'alerts.jsonl')
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'local')  # local | s3
 
 CORS(app)
 
@@ -63,10 +139,29 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
+def add_column_if_missing(cur, table, column, definition):
+    """إضافة عمود لجدول موجود (ترحيل قواعد البيانات القديمة)"""
+    columns = [row[1] for row in cur.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def salary_columns(salary_range):
+    """قيم (salary_min, salary_max, currency) للتخزين"""
+    salary_min, salary_max, currency = parse_salary(salary_range)
+    # "من 200 ألف" أو "حتى 300 ألف": نكمل الطرف الناقص بالمعروف ليبقى البحث بنطاق مفهرس
+    if salary_min is None:
+        salary_min = salary_max
+    if salary_max is None:
+        salary_max = salary_min
+    return salary_min, salary_max, currency
+
 def init_db():
     conn = get_db_connection()
     cur = conn.cursor()
     
+    # WAL: القراءات لا تنتظر الكتابة (الانتظار يوقف عامل gevent كاملاً - انظر gunicorn.conf.py)
+    cur.execute('PRAGMA journal_mode=WAL')
+    
     # جدول المستخدمين (شركات)
     cur.execute('''CREATE TABLE IF NOT EXISTS companies (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -115,40 +210,318 @@ def init_db():
         FOREIGN KEY (job_id) REFERENCES jobs (id)
     )''')
     
+    # سجل تغييرات حالة المتقدمين
+    cur.execute('''CREATE TABLE IF NOT EXISTS applicant_status_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        applicant_id INTEGER NOT NULL,
+        job_id INTEGER,
+        company_id INTEGER NOT NULL,
+        from_status TEXT,
+        to_status TEXT NOT NULL,
+        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (applicant_id) REFERENCES applicants (id)
+    )''')
+    
+    # دليل المواقع (المحافظات والمدن)
+    cur.execute('''CREATE TABLE IF NOT EXISTS locations (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        name_en TEXT,
+        parent_id INTEGER,
+        FOREIGN KEY (parent_id) REFERENCES locations (id)
+    )''')
+    cur.executemany('INSERT OR REPLACE INTO locations (id, name, name_en, parent_id) VALUES (?, ?, ?, ?)',
+                    [(loc['id'], loc['name'], loc['name_en'], loc['parent_id']) for loc in LOCATIONS.values()])
+    
+    # أعمدة مضافة لاحقاً
+    add_column_if_missing(cur, 'jobs', 'location_id', 'INTEGER REFERENCES locations (id)')
+    add_column_if_missing(cur, 'companies', 'location_id', 'INTEGER REFERENCES locations (id)')
+    add_column_if_missing(cur, 'jobs', 'salary_min', 'INTEGER')
+    add_column_if_missing(cur, 'jobs', 'salary_max', 'INTEGER')
+    add_column_if_missing(cur, 'jobs', 'currency', 'TEXT')
+    add_column_if_missing(cur, 'applicants', 'email_normalized', 'TEXT')
+    add_column_if_missing(cur, 'jobs', 'change_seq', 'INTEGER')
+    cur.execute('''UPDATE applicants SET email_normalized = lower(trim(email)) 
+                   WHERE email_normalized IS NULL''')
+    
+    # ردود /api/upload المحفوظة لإعادة إرسالها عند تكرار نفس Idempotency-Key
+    # (status_code فارغ = الطلب الأصلي ما زال قيد المعالجة)
+    columns = {row[1]: row[3] for row in cur.execute('PRAGMA table_info(idempotency_keys)')}
+    if columns.get('status_code'):
+        # الجدول القديم لا يسمح بالقيم الفارغة - محتواه مؤقت فيُعاد إنشاؤه
+        cur.execute('DROP TABLE idempotency_keys')
+    cur.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        status_code INTEGER,
+        response TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expires_at DATETIME NOT NULL
+    )''')
+    
+    # مفاتيح الرفع المباشر الصادرة من /api/upload/presign: تُقبل مرة واحدة ولنفس الوظيفة
+    cur.execute('''CREATE TABLE IF NOT EXISTS direct_uploads (
+        key TEXT PRIMARY KEY,
+        job_id INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expires_at DATETIME NOT NULL,
+        claimed_at DATETIME
+    )''')
+    
+    # تنبيهات الوظائف: البحوث المحفوظة والمطابقات والرسائل الصادرة
+    cur.execute('''CREATE TABLE IF NOT EXISTS saved_searches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL,
+        token TEXT NOT NULL UNIQUE,
+        category TEXT,
+        job_type TEXT,
+        location TEXT,
+        location_id INTEGER,
+        keywords TEXT,
+        is_active BOOLEAN DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (location_id) REFERENCES locations (id)
+    )''')
+    # البحث لا يُفعل قبل تأكيد البريد (رمز منفصل عن رمز الإلغاء الذي تعيده الواجهة)
+    add_column_if_missing(cur, 'saved_searches', 'confirm_token', 'TEXT')
+    cur.execute('''CREATE TABLE IF NOT EXISTS alert_matches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        saved_search_id INTEGER NOT NULL,
+        job_id INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        digested_at DATETIME,
+        UNIQUE (saved_search_id, job_id),
+        FOREIGN KEY (saved_search_id) REFERENCES saved_searches (id),
+        FOREIGN KEY (job_id) REFERENCES jobs (id)
+    )''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS alert_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        subject TEXT,
+        body TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        sent_at DATETIME
+    )''')
+    
+    # تسلسل تغييرات الوظائف لمزامنة التطبيق (تحافظ عليه المشغلات)
+    cur.execute('''CREATE TABLE IF NOT EXISTS sequences (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )''')
+    cur.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('jobs', 0)")
+    # أعلى تسلسل حذف تمت إزالته - المزامنة من قبله تحتاج إعادة تحميل كاملة
+    cur.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('jobs_floor', 0)")
+    cur.execute('''CREATE TABLE IF NOT EXISTS job_tombstones (
+        job_id INTEGER PRIMARY KEY,
+        change_seq INTEGER NOT NULL,
+        deleted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS trg_jobs_insert_seq AFTER INSERT ON jobs
+    BEGIN
+        UPDATE sequences SET value = value + 1 WHERE name = 'jobs';
+        UPDATE jobs SET change_seq = (SELECT value FROM sequences WHERE name = 'jobs') WHERE id = NEW.id;
+    END''')
+    # تحديث change_seq نفسه (من مشغل الإدراج) لا يُحسب تغييراً
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS trg_jobs_update_seq AFTER UPDATE ON jobs
+    WHEN NEW.change_seq IS OLD.change_seq
+    BEGIN
+        UPDATE sequences SET value = value + 1 WHERE name = 'jobs';
+        UPDATE jobs SET change_seq = (SELECT value FROM sequences WHERE name = 'jobs') WHERE id = NEW.id;
+    END''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS trg_jobs_delete_seq AFTER DELETE ON jobs
+    BEGIN
+        UPDATE sequences SET value = value + 1 WHERE name = 'jobs';
+        INSERT OR REPLACE INTO job_tombstones (job_id, change_seq) 
+        VALUES (OLD.id, (SELECT value FROM sequences WHERE name = 'jobs'));
+    END''')
+    # بيانات الشركة المضمنة في صفوف المزامنة: تغييرها يحدث تسلسل كل وظائفها
+    # (كل وظيفة تأخذ رقماً جديداً عبر trg_jobs_update_seq)
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS trg_companies_update_seq AFTER UPDATE ON companies
+    WHEN NEW.name IS NOT OLD.name OR NEW.logo_path IS NOT OLD.logo_path
+    BEGIN
+        UPDATE jobs SET is_active = is_active WHERE company_id = NEW.id;
+    END''')
+    # الوظائف الموجودة قبل إضافة التسلسل
+    if cur.execute('SELECT 1 FROM jobs WHERE change_seq IS NULL LIMIT 1').fetchone():
+        cur.execute('UPDATE jobs SET is_active = is_active WHERE change_seq IS NULL')
+    
+    # سجل أحداث الشركات (متقدم جديد، تغيير حالة) لبث لوحة التحكم
+    cur.execute('''CREATE TABLE IF NOT EXISTS company_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
+        event_type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (company_id) REFERENCES companies (id)
+    )''')
+    
+    # إحصائيات الوظائف بالساعة (مشاهدة، ضغط زر التقديم، تقديم ناجح)
+    cur.execute('''CREATE TABLE IF NOT EXISTS job_stats (
+        job_id INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (job_id, event, bucket)
+    ) WITHOUT ROWID''')
+    
+    # الفهارس
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_saved_searches_email ON saved_searches (email)')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_saved_searches_confirm ON saved_searches (confirm_token)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_company_events ON company_events (company_id, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_jobs_change_seq ON jobs (change_seq)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_job_tombstones_seq ON job_tombstones (change_seq)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_alert_matches_pending ON alert_matches (digested_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_alert_outbox_pending ON alert_outbox (sent_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_jobs_location ON jobs (location_id, is_active, created_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_companies_location ON companies (location_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_jobs_salary_min ON jobs (is_active, currency, salary_min)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_jobs_salary_max ON jobs (is_active, currency, salary_max)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys (expires_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_direct_uploads_expires ON direct_uploads (expires_at)')
+    try:
+        # منع تكرار التقديم على نفس الوظيفة بنفس البريد
+        cur.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_applicants_job_email 
+                       ON applicants (job_id, email_normalized)''')
+    except sqlite3.IntegrityError:
+        # قاعدة بيانات قديمة فيها تكرارات: فهرس عادي والتحقق يتم في التطبيق
+        cur.execute('''CREATE INDEX IF NOT EXISTS idx_applicants_job_email_dup 
+                       ON applicants (job_id, email_normalized)''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_jobs_company ON jobs (company_id, is_active)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_applicants_job_status ON applicants (job_id, status)')
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_status_history_company 
+                   ON applicant_status_history (company_id, to_status, changed_at)''')
+    cur.execute('''CREATE INDEX IF NOT EXISTS idx_status_history_applicant 
+                   ON applicant_status_history (applicant_id, changed_at)''')
+    
     # إضافة بيانات تجريبية
     try:
         # شركة تجريبية
         cur.execute('''INSERT OR IGNORE INTO companies 
-                     (name, email, password, phone, location, description) 
-                     VALUES (?, ?, ?, ?, ?, ?)''',
+                     (name, email, password, phone, location, location_id, description) 
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
                    ('شركة تطوير يمن', 'info@yemen-dev.com', 
                     generate_password_hash('123456'), '+967123456789', 
-                    'صنعاء', 'شركة رائدة في مجال التطوير البرمجي في اليمن'))
+                    'صنعاء', resolve_location('صنعاء'), 'شركة رائدة في مجال التطوير البرمجي في اليمن'))
         
         # وظائف تجريبية
         cur.execute('''INSERT OR IGNORE INTO jobs 
-                     (company_id, title, category, job_type, salary_range, location, description, requirements) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                     (company_id, title, category, job_type, salary_range, salary_min, salary_max, currency, 
+                      location, location_id, description, requirements) 
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                    (1, 'مطور ويب', 'تكنولوجيا المعلومات', 'دوام كامل', 
-                    '500,000 - 800,000 ريال', 'صنعاء', 
+                    '500,000 - 800,000 ريال', *salary_columns('500,000 - 800,000 ريال'), 
+                    'صنعاء', resolve_location('صنعاء'), 
                     'مطلوب مطور ويب مبتدئ للانضمام لفريقنا المتميز', 
                     'خبرة في HTML, CSS, JavaScript\nشهادة جامعية في تخصص الحاسوب'))
         
         cur.execute('''INSERT OR IGNORE INTO jobs 
-                     (company_id, title, category, job_type, salary_range, location, description) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     (company_id, title, category, job_type, salary_range, salary_min, salary_max, currency, 
+                      location, location_id, description) 
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                    (1, 'مدير مبيعات', 'المبيعات والتسويق', 'دوام كامل', 
-                    '600,000 - 900,000 ريال', 'تعز', 
+                    '600,000 - 900,000 ريال', *salary_columns('600,000 - 900,000 ريال'), 
+                    'تعز', resolve_location('تعز'), 
                     'مطلوب مدير مبيعات لديه خبرة في السوق اليمني'))
     
     except:
         pass
     
     conn.commit()
+    
+    # الصفوف الموجودة قبل إضافة location_id (مثل email_normalized و change_seq أعلاه)
+    backfill_locations(conn)
     conn.close()
 
+def backfill_locations(conn):
+    """تعبئة location_id للشركات والوظائف القديمة - يعيد عدد الصفوف المحدثة"""
+    updated = 0
+    companies = conn.execute('SELECT id, location FROM companies WHERE location_id IS NULL').fetchall()
+    for row in companies:
+        location_id = resolve_location(row['location'])
+        if location_id:
+            conn.execute('UPDATE companies SET location_id = ? WHERE id = ?', (location_id, row['id']))
+            updated += 1
+    
+    jobs_rows = conn.execute('''
+        SELECT j.id, j.location, c.location_id as company_location_id 
+        FROM jobs j 
+        LEFT JOIN companies c ON j.company_id = c.id 
+        WHERE j.location_id IS NULL
+    ''').fetchall()
+    for row in jobs_rows:
+        location_id = resolve_location(row['location']) or row['company_location_id']
+        if location_id:
+            conn.execute('UPDATE jobs SET location_id = ? WHERE id = ?', (location_id, row['id']))
+            updated += 1
+    
+    conn.commit()
+    return updated
+
+def backfill_salaries(conn, reparse=False):
+    """تحليل salary_range للوظائف القديمة - يعيد عدد الصفوف المحدثة
+    reparse: إعادة تحليل كل الصفوف (بعد تعديل المحلل)"""
+    query = 'SELECT id, salary_range FROM jobs WHERE salary_range IS NOT NULL'
+    if not reparse:
+        query += ' AND currency IS NULL'
+    rows = conn.execute(query).fetchall()
+    values = [(*salary_columns(row['salary_range']), row['id']) for row in rows]
+    values = [v for v in values if v[2]]
+    conn.executemany('UPDATE jobs SET salary_min = ?, salary_max = ?, currency = ? WHERE id = ?', values)
+    conn.commit()
+    return len(values)
+
 init_db()
 
+# فهرس البحوث المحفوظة (لكل عملية - يُحدث تدريجياً من قاعدة البيانات)
+saved_search_index = alerts.SavedSearchIndex()
+
+# عدادات المشاهدات والتقديم (لكل عملية - تُكتب دفعة واحدة كل STATS_FLUSH_SECONDS)
+job_events = analytics.EventCounter(get_db_connection, STATS_FLUSH_SECONDS)
+atexit.register(job_events.flush)
+
+# فاحص أحداث الشركات (لكل عملية - يوزع الجديد على اتصالات SSE المفتوحة)
+event_hub = events.EventHub(get_db_connection, EVENTS_POLL_SECONDS, EVENTS_RETENTION_DAYS)
+
+# فهرس الإكمال التلقائي (لكل عملية - يُعاد بناؤه عند تغير تسلسل الوظائف)
+suggest_index = suggest.SuggestIndex(SUGGEST_REFRESH_SECONDS)
+
+# تخزين السير الذاتية والفيديوهات والشعارات (محلي أو S3 - انظر storage.py)
+upload_storage = storage.get_storage(app.config['STORAGE_BACKEND'], UPLOAD_FOLDER)
+
+@app.cli.command('send-alert-digests')
+def send_alert_digests_command():
+    """إرسال ملخصات التنبيهات المعلقة (يُشغل دورياً): flask --app app send-alert-digests"""
+    conn = get_db_connection()
+    outbox = alerts.get_outbox(app.config['ALERT_OUTBOX'], conn, app.config['ALERT_OUTBOX_FILE'])
+    sent = alerts.send_digests(conn, outbox, os.environ.get('SITE_URL', ''))
+    conn.close()
+    print(f'تم إرسال {sent} ملخص')
+
+@app.cli.command('cleanup-direct-uploads')
+def cleanup_direct_uploads_command():
+    """حذف ملفات الرفع المباشر المهملة (يُشغل دورياً): flask --app app cleanup-direct-uploads"""
+    conn = get_db_connection()
+    deleted = cleanup_direct_uploads(conn)
+    conn.close()
+    print(f'تم حذف {deleted} ملف')
+
+@app.cli.command('backfill-salaries')
+@click.option('--reparse', is_flag=True, help='إعادة تحليل الصفوف المحللة مسبقاً أيضاً')
+def backfill_salaries_command(reparse):
+    """تحليل نطاقات الرواتب للبيانات الموجودة: flask --app app backfill-salaries [--reparse]"""
+    conn = get_db_connection()
+    updated = backfill_salaries(conn, reparse)
+    conn.close()
+    print(f'تم تحديث {updated} صف')
+
+@app.cli.command('backfill-locations')
+def backfill_locations_command():
+    """تعبئة معرفات المواقع للبيانات الموجودة: flask --app app backfill-locations"""
+    conn = get_db_connection()
+    updated = backfill_locations(conn)
+    conn.close()
+    print(f'تم تحديث {updated} صف')
+
 # ==============================
 # 🛠️ الدوال المساعدة
 # ==============================
@@ -168,6 +541,296 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def encode_logo_variant(data, size, fmt):
+    """تصغير الشعار إلى مربع شفاف بالمقاس والصيغة المطلوبة - يعيد BytesIO"""
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img).convert('RGBA')
+        img = ImageOps.contain(img, (size, size), Image.LANCZOS)
+        
+        # مربع شفاف بنفس المقاس لثبات تصميم البطاقات
+        canvas = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        canvas.paste(img, ((size - img.width) // 2, (size - img.height) // 2))
+        
+        output = io.BytesIO()
+        if fmt == 'webp':
+            canvas.save(output, LOGO_FORMATS[fmt], quality=80, method=6)
+        else:
+            canvas.save(output, LOGO_FORMATS[fmt], optimize=True)
+    output.seek(0)
+    return output
+
+def render_logo_variant(key, variant, fmt):
+    """إنشاء نسخة بمقاس وصيغة محددة من الشعار الأصلي وحفظها في التخزين"""
+    with closing(upload_storage.open(f"logos/{key}_original")) as src:
+        data = src.read()
+    # معالجة Pillow خارج حلقة gevent حتى لا تتوقف بقية الاتصالات
+    output = events.run_blocking(encode_logo_variant, data, LOGO_VARIANTS[variant], fmt)
+    upload_storage.save(f"logos/{key}_{variant}.{fmt}", output, f"image/{fmt}")
+
+def save_company_logo(company_id, file):
+    """التحقق من الشعار وحفظه وتوليد جميع النسخ - يعيد مفتاح الشعار أو رسالة خطأ"""
+    filename = secure_filename(file.filename or '')
+    if not allowed_file(filename, ALLOWED_IMAGES):
+        return None, 'نوع الصورة غير مدعوم'
+    
+    data = file.read(MAX_LOGO_SIZE + 1)
+    if len(data) > MAX_LOGO_SIZE:
+        return None, 'حجم الشعار كبير (2MB كحد أقصى)'
+    
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format not in ('PNG', 'JPEG', 'GIF'):
+                return None, 'نوع الصورة غير مدعوم'
+            if img.width * img.height > LOGO_MAX_PIXELS:
+                return None, 'أبعاد الشعار كبيرة جداً'
+            img.verify()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return None, 'ملف الصورة غير صالح'
+    
+    # المفتاح مبني على محتوى الملف فتتغير الروابط عند تغيير الشعار
+    key = f"{company_id}_{hashlib.sha256(data).hexdigest()[:16]}"
+    upload_storage.save(f"logos/{key}_original", io.BytesIO(data), file.mimetype)
+    
+    for variant in LOGO_VARIANTS:
+        for fmt in LOGO_FORMATS:
+            render_logo_variant(key, variant, fmt)
+    return key, None
+
+def delete_company_logo(key):
+    """حذف الشعار الأصلي وجميع نسخه"""
+    names = [f"{key}_original"] + [f"{key}_{variant}.{fmt}" 
+                                   for variant in LOGO_VARIANTS for fmt in LOGO_FORMATS]
+    for name in names:
+        upload_storage.delete(f"logos/{name}")
+
+@app.template_global()
+def logo_url(key, variant='thumb', fmt='webp'):
+    """رابط نسخة الشعار (يستخدم في القوالب وواجهات API)"""
+    if not key:
+        return None
+    return url_for('company_logo', filename=f"{key}_{variant}.{fmt}")
+
+def logo_urls(key):
+    """جميع روابط نسخ الشعار لواجهات API"""
+    if not key:
+        return None
+    return {variant: {fmt: logo_url(key, variant, fmt) for fmt in LOGO_FORMATS}
+            for variant in LOGO_VARIANTS}
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+def find_existing_application(conn, job_id, email):
+    """معرف طلب سابق لنفس البريد على نفس الوظيفة - أو None"""
+    row = conn.execute('SELECT id FROM applicants WHERE job_id = ? AND email_normalized = ?',
+                       (job_id, normalize_email(email))).fetchone()
+    return row['id'] if row else None
+
+def claim_idempotency_key(key):
+    """حجز المفتاح قبل قراءة الملفات أو حفظها - يعيد None إذا حُجز لهذا الطلب، أو الصف الموجود"""
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= datetime('now')")
+            conn.execute('''INSERT INTO idempotency_keys (key, expires_at) 
+                            VALUES (?, datetime('now', ?))''', (key, f'+{IDEMPOTENCY_LOCK_MINUTES} minutes'))
+        return None
+    except sqlite3.IntegrityError:
+        return conn.execute('SELECT status_code, response FROM idempotency_keys WHERE key = ?', 
+                            (key,)).fetchone()
+    finally:
+        conn.close()
+
+def release_idempotency_key(key):
+    """تحرير مفتاح طلب لم ينجح حتى يمكن إعادة المحاولة بنفس المفتاح"""
+    conn = get_db_connection()
+    conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL', (key,))
+    conn.commit()
+    conn.close()
+
+def salary_filters(args):
+    """شروط وترتيب الراتب المشتركة بين /jobs و /api/jobs/ - تعيد (شروط SQL, المعاملات, الترتيب)"""
+    min_salary = args.get('min_salary', type=sqlite_int)
+    max_salary = args.get('max_salary', type=sqlite_int)
+    sort = args.get('sort', '')
+    currency = args.get('currency', DEFAULT_CURRENCY).upper()
+    if currency not in CURRENCIES:
+        currency = DEFAULT_CURRENCY
+    
+    conditions = ''
+    params = []
+    # المقارنة لها معنى داخل عملة واحدة فقط، وتسمح باستخدام الفهرس (is_active, currency, salary_*)
+    if min_salary is not None or max_salary is not None:
+        conditions += ' AND j.currency = ?'
+        params.append(currency)
+    if min_salary is not None:
+        conditions += ' AND j.salary_max >= ?'
+        params.append(min_salary)
+    if max_salary is not None:
+        conditions += ' AND j.salary_min <= ?'
+        params.append(max_salary)
+    
+    # الترتيب وحده لا يستبعد شيئاً: العملة المختارة أولاً، ثم باقي العملات، ثم الوظائف بدون راتب محدد
+    # (العملة من القائمة المسموحة فقط فيمكن إدراجها في النص)
+    if sort == 'salary':
+        order_by = (f"j.currency IS NULL, j.currency != '{currency}', j.currency, "
+                    'j.salary_max DESC, j.created_at DESC')
+    else:
+        order_by = 'j.created_at DESC'
+    return conditions, params, order_by
+
+def sqlite_int(value):
+    """int مقيد بنطاق أعداد SQLite (64 بت) حتى لا يرفع الربط OverflowError -
+    للاستخدام مع request.args.get(..., type=sqlite_int)"""
+    return min(max(int(value), SQLITE_INT_MIN), SQLITE_INT_MAX)
+
+def chunked(items, size=500):
+    """تقسيم القائمة إلى دفعات (حد متغيرات SQLite)"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def log_company_event(conn, company_id, event_type, payload):
+    """تسجيل حدث للوحة تحكم الشركة ضمن نفس المعاملة - بدون commit"""
+    conn.execute('INSERT INTO company_events (company_id, event_type, payload) VALUES (?, ?, ?)',
+                 (company_id, event_type, json.dumps(payload, ensure_ascii=False)))
+
+def change_applicants_status(conn, company_id, applicant_ids, new_status):
+    """تغيير حالة مجموعة متقدمين تابعين للشركة وتسجيل الانتقالات - بدون commit"""
+    owned = []
+    for chunk in chunked(applicant_ids):
+        placeholders = ','.join('?' * len(chunk))
+        owned.extend(conn.execute(f'''
+            SELECT a.id, a.job_id, a.status 
+            FROM applicants a 
+            JOIN jobs j ON a.job_id = j.id 
+            WHERE j.company_id = ? AND a.id IN ({placeholders})
+        ''', [company_id, *chunk]).fetchall())
+    
+    changed = [row for row in owned if row['status'] != new_status]
+    changed_ids = [row['id'] for row in changed]
+    for chunk in chunked(changed_ids):
+        placeholders = ','.join('?' * len(chunk))
+        conn.execute(f'UPDATE applicants SET status = ? WHERE id IN ({placeholders})',
+                     [new_status, *chunk])
+    conn.executemany('''INSERT INTO applicant_status_history 
+                        (applicant_id, job_id, company_id, from_status, to_status) 
+                        VALUES (?, ?, ?, ?, ?)''',
+                     [(row['id'], row['job_id'], company_id, row['status'], new_status)
+                      for row in changed])
+    if changed_ids:
+        log_company_event(conn, company_id, 'status', {
+            'applicant_ids': changed_ids,
+            'status': new_status
+        })
+    
+    return [row['id'] for row in owned], changed_ids
+
+def upload_url_to_key(url):
+    """تحويل مسار الملف المخزن (/uploads/cvs/...) إلى مفتاح في التخزين"""
+    if not url:
+        return None
+    for folder in ('cvs', 'videos'):
+        prefix = f'/uploads/{folder}/'
+        if url.startswith(prefix):
+            name = url[len(prefix):]
+            # منع الخروج من مجلد الرفع
+            if name != os.path.basename(name) or name in ('', '.', '..'):
+                return None
+            return f'{folder}/{name}'
+    return None
+
+def store_upload(file, folder, prefix, filename):
+    """حفظ ملف مرفوع في التخزين - يعيد المسار الذي يُحفظ في قاعدة البيانات"""
+    save_name = f"{prefix}_{int(datetime.now().timestamp())}_{filename}"
+    upload_storage.save(f"{folder}/{save_name}", file.stream, file.mimetype)
+    return f"/uploads/{folder}/{save_name}"
+
+def direct_upload_path(conn, key, job_id, folder, allowed, max_size):
+    """التحقق من ملف رُفع مباشرة إلى التخزين (رابط موقع) - يعيد (المسار, الخطأ)"""
+    if not key.startswith(f'{folder}/') or upload_url_to_key(f'/uploads/{key}') != key:
+        return None, 'مفتاح الملف غير صالح'
+    if not allowed_file(key, allowed):
+        return None, 'نوع الملف غير مدعوم'
+    # المفتاح صادر من /api/upload/presign لهذه الوظيفة، ولم يُستخدم ولم تنتهِ مهلته
+    grant = conn.execute('''SELECT 1 FROM direct_uploads WHERE key = ? AND job_id = ? 
+                            AND claimed_at IS NULL AND expires_at > datetime('now')''',
+                         (key, job_id)).fetchone()
+    if not grant:
+        return None, 'مفتاح الملف غير صالح'
+    path = f'/uploads/{key}'
+    if conn.execute('SELECT 1 FROM applicants WHERE job_id = ? AND (cv_path = ? OR video_path = ?)',
+                    (job_id, path, path)).fetchone():
+        return None, 'الملف مستخدم في طلب آخر'
+    size = upload_storage.size(key)
+    if size is None:
+        return None, 'الملف غير موجود في التخزين'
+    if size > max_size:
+        return None, 'حجم الملف كبير'
+    return path, None
+
+def claim_direct_uploads(conn, keys):
+    """تعليم المفاتيح كمستخدمة ضمن معاملة الإدراج - False إذا سبقنا طلب آخر إلى أحدها (بدون commit)"""
+    if not keys:
+        return True
+    placeholders = ','.join('?' * len(keys))
+    cur = conn.execute(f'''UPDATE direct_uploads SET claimed_at = CURRENT_TIMESTAMP 
+                            WHERE key IN ({placeholders}) AND claimed_at IS NULL''', keys)
+    return cur.rowcount == len(keys)
+
+def cleanup_direct_uploads(conn):
+    """حذف الملفات المرفوعة مباشرة التي لم تُرسل إلى /api/upload خلال المهلة - يعيد عددها"""
+    rows = conn.execute('''SELECT key FROM direct_uploads 
+                           WHERE claimed_at IS NULL AND expires_at <= datetime('now')''').fetchall()
+    for row in rows:
+        upload_storage.delete(row['key'])
+    # المفاتيح المستخدمة يحميها صف المتقدم بعد انتهاء المهلة
+    conn.execute("DELETE FROM direct_uploads WHERE expires_at <= datetime('now')")
+    conn.commit()
+    return len(rows)
+
+def csv_safe(value):
+    """منع تنفيذ النصوص كمعادلات عند فتح الملف في Excel (=HYPERLINK...)"""
+    if isinstance(value, str) and value.startswith(('=', '+', '-', '@', '\t', '\r')):
+        return "'" + value
+    return value
+
+class ZipStream(io.RawIOBase):
+    """ملف للكتابة فقط غير قابل للتنقل - يجمع ما يكتبه zipfile ليتم بثه"""
+    
+    def __init__(self):
+        self._buffer = bytearray()
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+    
+    def pop(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def pipeline_counts(conn, company_id, job_id=None):
+    """عدد المتقدمين في كل مرحلة للشركة (أو لوظيفة واحدة)"""
+    query = '''
+        SELECT a.status, COUNT(*) AS total 
+        FROM jobs j 
+        JOIN applicants a ON a.job_id = j.id 
+        WHERE j.company_id = ?
+    '''
+    params = [company_id]
+    if job_id is not None:
+        query += ' AND j.id = ?'
+        params.append(job_id)
+    query += ' GROUP BY a.status'
+    
+    counts = {status: 0 for status in APPLICANT_STATUSES}
+    for row in conn.execute(query, params):
+        counts[row['status']] = row['total']
+    return counts
+
 # ==============================
 # 🏠 الصفحات الرئيسية
 # ==============================
@@ -176,7 +839,7 @@ def login_required(f):
 def index():
     conn = get_db_connection()
     featured_jobs = conn.execute('''
-        SELECT j.*, c.name as company_name 
+        SELECT j.*, c.name as company_name, c.logo_path as company_logo 
         FROM jobs j 
         JOIN companies c ON j.company_id = c.id 
         WHERE j.is_active = 1 
@@ -197,20 +860,27 @@ def index():
 
 @app.route('/jobs')
 def jobs():
+    q = request.args.get('q', '').strip()
     category = request.args.get('category', '')
     job_type = request.args.get('type', '')
     location = request.args.get('location', '')
+    nearby = request.args.get('nearby') == '1'
     
     conn = get_db_connection()
     
     query = '''
-        SELECT j.*, c.name as company_name, c.location as company_location 
+        SELECT j.*, c.name as company_name, c.location as company_location, 
+               c.logo_path as company_logo 
         FROM jobs j 
         JOIN companies c ON j.company_id = c.id 
         WHERE j.is_active = 1
     '''
     params = []
     
+    if q:
+        query += ' AND (j.title LIKE ? OR c.name LIKE ?)'
+        params.append(f'%{q}%')
+        params.append(f'%{q}%')
     if category:
         query += ' AND j.category = ?'
         params.append(category)
@@ -218,11 +888,24 @@ def jobs():
         query += ' AND j.job_type = ?'
         params.append(job_type)
     if location:
-        query += ' AND (j.location LIKE ? OR c.location LIKE ?)'
-        params.append(f'%{location}%')
-        params.append(f'%{location}%')
+        location_ids = expand_location(resolve_location(location), nearby)
+        if location_ids:
+            # بحث مفهرس بالمعرف بدلاً من LIKE على النص، والنص فقط لوظائف لم يُعرف موقعها
+            query += f""" AND (j.location_id IN ({','.join('?' * len(location_ids))}) 
+                               OR (j.location_id IS NULL AND (j.location LIKE ? OR c.location LIKE ?)))"""
+            params.extend(location_ids)
+            params.append(f'%{location}%')
+            params.append(f'%{location}%')
+        else:
+            query += ' AND (j.location LIKE ? OR c.location LIKE ?)'
+            params.append(f'%{location}%')
+            params.append(f'%{location}%')
     
-    query += ' ORDER BY j.created_at DESC'
+    salary_conditions, salary_params, order_by = salary_filters(request.args)
+    query += salary_conditions
+    params.extend(salary_params)
+    
+    query += f' ORDER BY {order_by}'
     jobs_list = conn.execute(query, params).fetchall()
     
     categories = conn.execute('SELECT DISTINCT category FROM jobs WHERE category IS NOT NULL').fetchall()
@@ -234,9 +917,17 @@ def jobs():
                          jobs=jobs_list, 
                          categories=categories,
                          job_types=job_types,
+                         selected_q=q,
                          selected_category=category,
                          selected_type=job_type,
-                         selected_location=location)
+                         selected_location=location,
+                         selected_nearby=nearby,
+                         selected_min_salary=request.args.get('min_salary', ''),
+                         selected_max_salary=request.args.get('max_salary', ''),
+                         selected_currency=request.args.get('currency', DEFAULT_CURRENCY),
+                         selected_sort=request.args.get('sort', ''),
+                         currencies=CURRENCIES,
+                         locations=[loc for loc in LOCATIONS.values() if not loc['parent_id']])
 
 # ==============================
 # 👥 تسجيل الشركات
@@ -265,9 +956,9 @@ def company_register():
         conn = get_db_connection()
         try:
             cur = conn.cursor()
-            cur.execute('''INSERT INTO companies (name, email, password, phone, location, description) 
-                         VALUES (?, ?, ?, ?, ?, ?)''',
-                       (name, email, hashed_password, phone, location, description))
+            cur.execute('''INSERT INTO companies (name, email, password, phone, location, location_id, description) 
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                       (name, email, hashed_password, phone, location, resolve_location(location), description))
             conn.commit()
             company_id = cur.lastrowid
             conn.close()
@@ -351,13 +1042,98 @@ def company_dashboard():
         LIMIT 10
     ''', (company_id,)).fetchall()
     
+    company_logo = conn.execute('SELECT logo_path FROM companies WHERE id = ?', 
+                                (company_id,)).fetchone()['logo_path']
+    
+    # مشاهدات وتقديمات آخر 30 يوماً
+    funnels = analytics.job_funnels(conn, company_id)
+    
     conn.close()
     
     return render_template('company_dashboard.html',
+                         company_logo=company_logo,
+                         funnels=funnels,
                          stats=stats,
                          jobs=jobs_list,
                          applicants=recent_applicants)
 
+@app.route('/company/logo', methods=['POST'])
+@login_required
+def upload_company_logo():
+    logo_file = request.files.get('logo')
+    if not logo_file or not logo_file.filename:
+        flash('يرجى اختيار صورة الشعار', 'error')
+        return redirect(url_for('company_dashboard'))
+    
+    company_id = session['company_id']
+    key, error = save_company_logo(company_id, logo_file)
+    if error:
+        flash(error, 'error')
+        return redirect(url_for('company_dashboard'))
+    
+    conn = get_db_connection()
+    old_key = conn.execute('SELECT logo_path FROM companies WHERE id = ?', 
+                           (company_id,)).fetchone()['logo_path']
+    conn.execute('UPDATE companies SET logo_path = ? WHERE id = ?', (key, company_id))
+    conn.commit()
+    conn.close()
+    
+    if old_key and old_key != key:
+        delete_company_logo(old_key)
+    
+    flash('تم تحديث شعار الشركة بنجاح', 'success')
+    return redirect(url_for('company_dashboard'))
+
+@app.route('/company/events')
+@login_required
+@limiter.exempt
+def company_events():
+    """
+    بث أحداث الشركة (Server-Sent Events): متقدمون جدد وتغييرات الحالة.
+    يدعم Last-Event-ID للاستئناف. الأحداث الجديدة يقرأها فاحص واحد لكل عملية (events.py)
+    ويوزعها على الاتصالات. الاتصالات طويلة لذا يجب تشغيل gunicorn بعمال gevent
+    (انظر gunicorn.conf.py) حتى لا يحجز كل اتصال عاملاً كاملاً.
+    """
+    company_id = session['company_id']
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', ''))
+    
+    def generate():
+        started = time.monotonic()
+        # الاشتراك قبل قراءة الفائت: حتى start_id يُقرأ هنا، وما بعده يصل من الفاحص المشترك
+        inbox, start_id = event_hub.subscribe(company_id)
+        try:
+            yield f'retry: {int(EVENTS_POLL_SECONDS * 1000)}\n\n'
+            
+            # اتصال جديد يبدأ من الآن بدون إعادة الأحداث القديمة
+            if last_event_id.isdigit():
+                conn = get_db_connection()
+                missed = conn.execute('''SELECT id, event_type, payload FROM company_events 
+                                         WHERE company_id = ? AND id > ? AND id <= ? ORDER BY id''',
+                                      (company_id, int(last_event_id), start_id)).fetchall()
+                conn.close()
+                for row in missed:
+                    yield f"id: {row['id']}\nevent: {row['event_type']}\ndata: {row['payload']}\n\n"
+            
+            while time.monotonic() - started < EVENTS_STREAM_SECONDS:
+                try:
+                    row = inbox.get(timeout=EVENTS_HEARTBEAT_SECONDS)
+                except Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"id: {row['id']}\nevent: {row['event_type']}\ndata: {row['payload']}\n\n"
+        finally:
+            event_hub.unsubscribe(company_id, inbox)
+    
+    # بعد انتهاء المدة يعيد المتصفح الاتصال تلقائياً مع Last-Event-ID
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 # ==============================
 # 💼 إدارة الوظائف
 # ==============================
@@ -394,21 +1170,46 @@ def add_job():
             return render_template('add_job.html')
         
         conn = get_db_connection()
+        
+        # موقع الوظيفة، وإن لم يُعرف فموقع الشركة
+        location_id = resolve_location(location)
+        if not location_id:
+            location_id = conn.execute('SELECT location_id FROM companies WHERE id = ?', 
+                                       (session['company_id'],)).fetchone()['location_id']
+        
         cur = conn.cursor()
         cur.execute('''INSERT INTO jobs 
-                     (company_id, title, category, job_type, salary_range, location, 
-                      description, requirements, benefits, experience_level, deadline) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                   (session['company_id'], title, category, job_type, salary_range, location,
-                    description, requirements, benefits, experience_level, deadline))
+                     (company_id, title, category, job_type, salary_range, salary_min, salary_max, currency, 
+                      location, location_id, description, requirements, benefits, experience_level, deadline) 
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                   (session['company_id'], title, category, job_type, salary_range, *salary_columns(salary_range),
+                    location, location_id, description, requirements, benefits, experience_level, deadline))
+        alerts.match_new_jobs(conn, saved_search_index, [cur.lastrowid])
         conn.commit()
         conn.close()
+        suggest_index.invalidate()
         
         flash('تم إضافة الوظيفة بنجاح!', 'success')
         return redirect(url_for('company_jobs'))
     
     return render_template('add_job.html')
 
+@app.route('/company/jobs/toggle/<int:job_id>', methods=['POST'])
+@login_required
+def toggle_job(job_id):
+    conn = get_db_connection()
+    cur = conn.execute('UPDATE jobs SET is_active = NOT is_active WHERE id = ? AND company_id = ?',
+                       (job_id, session['company_id']))
+    conn.commit()
+    conn.close()
+    
+    if cur.rowcount:
+        suggest_index.invalidate()
+        flash('تم تحديث حالة الوظيفة', 'success')
+    else:
+        flash('الوظيفة غير موجودة', 'error')
+    return redirect(url_for('company_jobs'))
+
 # ==============================
 # 👤 إدارة المتقدمين
 # ==============================
@@ -426,21 +1227,201 @@ def company_applicants():
         ORDER BY a.created_at DESC
     ''', (session['company_id'],)).fetchall()
     conn.close()
-    return render_template('company_applicants.html', applicants=applicants)
+    return render_template('company_applicants.html', 
+                         applicants=applicants,
+                         statuses=APPLICANT_STATUSES)
 
 @app.route('/company/applicants/<int:applicant_id>/update_status', methods=['POST'])
 @login_required
 def update_applicant_status(applicant_id):
     new_status = request.form.get('status')
     
+    if new_status not in APPLICANT_STATUSES:
+        flash('حالة غير صالحة', 'error')
+        return redirect(url_for('company_applicants'))
+    
     conn = get_db_connection()
-    conn.execute('UPDATE applicants SET status = ? WHERE id = ?', (new_status, applicant_id))
+    owned, _ = change_applicants_status(conn, session['company_id'], [applicant_id], new_status)
     conn.commit()
     conn.close()
     
-    flash('تم تحديث حالة المتقدم بنجاح', 'success')
+    if not owned:
+        flash('المتقدم غير موجود', 'error')
+    else:
+        flash('تم تحديث حالة المتقدم بنجاح', 'success')
     return redirect(url_for('company_applicants'))
 
+@app.route('/company/applicants/bulk_status', methods=['POST'])
+@login_required
+def bulk_update_applicant_status():
+    """تحديث حالة عدة متقدمين في معاملة واحدة - يعيد JSON"""
+    data = request.get_json(silent=True) or {}
+    new_status = data.get('status', request.form.get('status'))
+    applicant_ids = data.get('applicant_ids', request.form.getlist('applicant_ids'))
+    
+    if new_status not in APPLICANT_STATUSES:
+        return jsonify({'error': 'حالة غير صالحة', 'statuses': APPLICANT_STATUSES}), 400
+    
+    # قائمة أرقام فقط (النماذج ترسلها نصوصاً) - لا نص واحد ولا true/false، وضمن نطاق SQLite
+    if not isinstance(applicant_ids, list) or not all(
+            (isinstance(i, int) and not isinstance(i, bool)) or (isinstance(i, str) and i.isdecimal())
+            for i in applicant_ids):
+        return jsonify({'error': 'معرفات المتقدمين غير صالحة'}), 400
+    applicant_ids = sorted({int(i) for i in applicant_ids})
+    if applicant_ids and not (SQLITE_INT_MIN <= applicant_ids[0] and applicant_ids[-1] <= SQLITE_INT_MAX):
+        return jsonify({'error': 'معرفات المتقدمين غير صالحة'}), 400
+    
+    if not applicant_ids:
+        return jsonify({'error': 'لم يتم اختيار أي متقدم'}), 400
+    if len(applicant_ids) > MAX_BULK_APPLICANTS:
+        return jsonify({'error': f'الحد الأقصى {MAX_BULK_APPLICANTS} متقدم في المرة الواحدة'}), 400
+    
+    company_id = session['company_id']
+    conn = get_db_connection()
+    try:
+        owned, changed = change_applicants_status(conn, company_id, applicant_ids, new_status)
+        conn.commit()
+        counts = pipeline_counts(conn, company_id)
+    finally:
+        conn.close()
+    
+    owned_set = set(owned)
+    return jsonify({
+        'success': True,
+        'status': new_status,
+        'updated': changed,
+        'not_found': [i for i in applicant_ids if i not in owned_set],
+        'counts': counts
+    })
+
+@app.route('/api/company/funnel')
+@login_required
+def api_company_funnel():
+    """المشاهدات ونقرات التقديم والتقديمات الناجحة لكل وظيفة من وظائف الشركة"""
+    job_id = request.args.get('job_id', type=sqlite_int)
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    conn = get_db_connection()
+    funnels = analytics.job_funnels(conn, session['company_id'], job_id, days)
+    conn.close()
+    return jsonify({
+        'days': days,
+        'jobs': [{'job_id': job, **counts} for job, counts in funnels.items()]
+    })
+
+@app.route('/api/company/pipeline')
+@login_required
+def api_company_pipeline():
+    """عدد المتقدمين في كل مرحلة لوظائف الشركة"""
+    job_id = request.args.get('job_id', type=sqlite_int)
+    conn = get_db_connection()
+    counts = pipeline_counts(conn, session['company_id'], job_id)
+    conn.close()
+    return jsonify({
+        'statuses': APPLICANT_STATUSES,
+        'counts': counts
+    })
+
+@app.route('/company/jobs/<int:job_id>/applicants/export.zip')
+@login_required
+def export_job_applicants(job_id):
+    """تصدير ملفات المتقدمين لوظيفة كأرشيف ZIP يتم بثه مباشرة بدون ملفات مؤقتة"""
+    include_videos = request.args.get('videos') == '1'
+    company_id = session['company_id']
+    
+    conn = get_db_connection()
+    job = conn.execute('SELECT id, title FROM jobs WHERE id = ? AND company_id = ?',
+                       (job_id, company_id)).fetchone()
+    conn.close()
+    
+    if not job:
+        flash('الوظيفة غير موجودة', 'error')
+        return redirect(url_for('company_jobs'))
+    
+    query = '''
+        SELECT id, full_name, email, phone, status, cv_path, video_path, created_at 
+        FROM applicants 
+        WHERE job_id = ? 
+        ORDER BY id
+    '''
+    
+    def entry_name(folder, applicant_id, url):
+        return f"{folder}/{applicant_id}_{secure_filename(os.path.basename(url)) or 'file'}"
+    
+    def generate():
+        stream = ZipStream()
+        conn = get_db_connection()
+        available = set()
+        
+        def stored_key(url):
+            key = upload_url_to_key(url)
+            if key and upload_storage.exists(key):
+                available.add(key)
+                return key
+            return None
+        
+        try:
+            with zipfile.ZipFile(stream, 'w', allowZip64=True) as zf:
+                # ملف البيانات أولاً (مضغوط)
+                info = zipfile.ZipInfo('applicants.csv', datetime.now().timetuple()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with zf.open(info, 'w', force_zip64=True) as entry:
+                    text = io.TextIOWrapper(entry, encoding='utf-8-sig', newline='')
+                    writer = csv.writer(text)
+                    writer.writerow(['id', 'full_name', 'email', 'phone', 'status', 
+                                     'created_at', 'cv_file', 'video_file'])
+                    for row in conn.execute(query, (job_id,)):
+                        writer.writerow([
+                            row['id'], csv_safe(row['full_name']), csv_safe(row['email']), 
+                            csv_safe(row['phone']), row['status'], row['created_at'],
+                            entry_name('cvs', row['id'], row['cv_path'])
+                            if stored_key(row['cv_path']) else '',
+                            entry_name('videos', row['id'], row['video_path'])
+                            if include_videos and stored_key(row['video_path']) else ''
+                        ])
+                        text.flush()
+                        yield stream.pop()
+                    text.detach()
+                yield stream.pop()
+                
+                # الملفات مخزنة بدون ضغط (PDF/DOCX/MP4 مضغوطة أصلاً)
+                for row in conn.execute(query, (job_id,)):
+                    files = [('cvs', row['cv_path'])]
+                    if include_videos:
+                        files.append(('videos', row['video_path']))
+                    
+                    for folder, url in files:
+                        key = upload_url_to_key(url)
+                        if key not in available:
+                            continue
+                        # ملف حُذف بعد كتابة قائمة البيانات: نتخطاه بدلاً من قطع الأرشيف
+                        try:
+                            source = upload_storage.open(key)
+                        except FileNotFoundError:
+                            continue
+                        info = zipfile.ZipInfo(entry_name(folder, row['id'], url), datetime.now().timetuple()[:6])
+                        info.compress_type = zipfile.ZIP_STORED
+                        with closing(source) as src, zf.open(info, 'w', force_zip64=True) as entry:
+                            while True:
+                                chunk = src.read(STREAM_CHUNK_SIZE)
+                                if not chunk:
+                                    break
+                                entry.write(chunk)
+                                yield stream.pop()
+                        yield stream.pop()
+            yield stream.pop()
+        finally:
+            conn.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="job_{job_id}_applicants.zip"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 # ==============================
 # 📤 التقديم على الوظائف (للمتقدمين)
 # ==============================
@@ -473,6 +1454,11 @@ def apply_job(job_id):
             flash('يرجى إدخال الاسم والبريد الإلكتروني', 'error')
             return render_template('apply_job.html', job=job)
         
+        if find_existing_application(conn, job_id, email):
+            conn.close()
+            flash('لقد تقدمت لهذه الوظيفة مسبقاً', 'error')
+            return redirect(url_for('job_details', job_id=job_id))
+        
         cv_path = None
         video_path = None
         
@@ -489,10 +1475,7 @@ def apply_job(job_id):
                 return render_template('apply_job.html', job=job)
             cv_file.seek(0)
             
-            save_name = f"cv_{int(datetime.now().timestamp())}_{filename}"
-            save_path = os.path.join(app.config['CV_FOLDER'], save_name)
-            cv_file.save(save_path)
-            cv_path = f"/uploads/cvs/{save_name}"
+            cv_path = store_upload(cv_file, 'cvs', 'cv', filename)
         
         # رفع الفيديو
         if video_file and video_file.filename:
@@ -507,23 +1490,40 @@ def apply_job(job_id):
                 return render_template('apply_job.html', job=job)
             video_file.seek(0)
             
-            save_name = f"video_{int(datetime.now().timestamp())}_{filename}"
-            save_path = os.path.join(app.config['VIDEO_FOLDER'], save_name)
-            video_file.save(save_path)
-            video_path = f"/uploads/videos/{save_name}"
+            video_path = store_upload(video_file, 'videos', 'video', filename)
         
         # حفظ بيانات المتقدم
         cur = conn.cursor()
-        cur.execute('''INSERT INTO applicants (job_id, full_name, email, phone, cv_path, video_path, cover_letter) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                   (job_id, full_name, email, phone, cv_path, video_path, cover_letter))
+        try:
+            cur.execute('''INSERT INTO applicants (job_id, full_name, email, email_normalized, phone, 
+                                                   cv_path, video_path, cover_letter) 
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                       (job_id, full_name, email, normalize_email(email), phone, 
+                        cv_path, video_path, cover_letter))
+        except sqlite3.IntegrityError:
+            # طلب متزامن بنفس البريد سبقنا إلى الإدراج
+            conn.close()
+            for path in (cv_path, video_path):
+                if path:
+                    upload_storage.delete(upload_url_to_key(path))
+            flash('لقد تقدمت لهذه الوظيفة مسبقاً', 'error')
+            return redirect(url_for('job_details', job_id=job_id))
+        log_company_event(conn, job['company_id'], 'applicant', {
+            'applicant_id': cur.lastrowid,
+            'job_id': job_id,
+            'job_title': job['title'],
+            'full_name': full_name,
+            'status': APPLICANT_STATUSES[0]
+        })
         conn.commit()
         conn.close()
         
+        job_events.record(job_id, 'apply_success')
         flash('تم تقديم طلبك بنجاح! سنقوم بمراجعته قريباً.', 'success')
         return redirect(url_for('job_details', job_id=job_id))
     
     conn.close()
+    job_events.record(job_id, 'apply_click')
     return render_template('apply_job.html', job=job)
 
 @app.route('/job/<int:job_id>')
@@ -531,7 +1531,8 @@ def job_details(job_id):
     conn = get_db_connection()
     job = conn.execute('''
         SELECT j.*, c.name as company_name, c.location as company_location, 
-               c.description as company_description, c.phone as company_phone 
+               c.description as company_description, c.phone as company_phone, 
+               c.logo_path as company_logo 
         FROM jobs j 
         JOIN companies c ON j.company_id = c.id 
         WHERE j.id = ? AND j.is_active = 1
@@ -542,6 +1543,7 @@ def job_details(job_id):
         flash('الوظيفة غير متاحة', 'error')
         return redirect(url_for('jobs'))
     
+    job_events.record(job_id, 'view')
     return render_template('job_details.html', job=job)
 
 # ==============================
@@ -551,88 +1553,463 @@ def job_details(job_id):
 @app.route('/api/jobs/', methods=['GET'])
 def api_jobs():
     conn = get_db_connection()
-    rows = conn.execute('''
-        SELECT j.*, c.name as company_name 
+    salary_conditions, params, order_by = salary_filters(request.args)
+    rows = conn.execute(f'''
+        SELECT j.*, c.name as company_name, c.logo_path as company_logo 
         FROM jobs j 
         JOIN companies c ON j.company_id = c.id 
-        WHERE j.is_active = 1 
-        ORDER BY j.created_at DESC
-    ''').fetchall()
+        WHERE j.is_active = 1 {salary_conditions} 
+        ORDER BY {order_by}
+    ''', params).fetchall()
     jobs_list = [dict(row) for row in rows]
+    for job in jobs_list:
+        job['company_logo'] = logo_urls(job['company_logo'])
     conn.close()
     return jsonify(jobs_list)
 
+def prune_job_tombstones(conn):
+    """حذف سجلات الحذف القديمة ورفع حد المزامنة - بدون commit"""
+    pruned = conn.execute('''SELECT MAX(change_seq) FROM job_tombstones 
+                             WHERE deleted_at < datetime('now', ?)''',
+                          (f'-{SYNC_TOMBSTONE_DAYS} days',)).fetchone()[0]
+    if pruned:
+        conn.execute('DELETE FROM job_tombstones WHERE change_seq <= ?', (pruned,))
+        conn.execute("UPDATE sequences SET value = MAX(value, ?) WHERE name = 'jobs_floor'", (pruned,))
+
+def compressed_response(body, mimetype):
+    """ضغط gzip إذا كان العميل يقبله"""
+    response = app.response_class(body, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and len(body) > 1024:
+        response.set_data(gzip.compress(body if isinstance(body, bytes) else body.encode('utf-8'), 6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/api/jobs/sync', methods=['GET'])
+def api_jobs_sync():
+    """
+    مزامنة تدريجية للتطبيق: الوظائف التي أضيفت أو تغيرت أو أوقفت منذ since.
+    format=json (افتراضي) أو ndjson أو msgpack، مع gzip حسب Accept-Encoding.
+    إذا كان since أقدم من سجلات الحذف المحفوظة يعيد reset=true وقائمة كاملة.
+    """
+    since = request.args.get('since', '0')
+    output = request.args.get('format', 'json')
+    if not since.isdigit():
+        return jsonify({'error': 'رمز المزامنة غير صالح'}), 400
+    if output not in ('json', 'ndjson', 'msgpack'):
+        return jsonify({'error': 'صيغة غير مدعومة'}), 400
+    if output == 'msgpack' and msgpack is None:
+        return jsonify({'error': 'صيغة msgpack غير متاحة على الخادم'}), 406
+    since = int(since)
+    
+    conn = get_db_connection()
+    prune_job_tombstones(conn)
+    conn.commit()
+    
+    floor, current = conn.execute('''SELECT MAX(CASE WHEN name = 'jobs_floor' THEN value END), 
+                                            MAX(CASE WHEN name = 'jobs' THEN value END) 
+                                     FROM sequences''').fetchone()
+    reset = since == 0 or since < floor or since > current
+    if reset:
+        since = 0
+    
+    rows = conn.execute('''
+        SELECT j.*, c.name as company_name, c.logo_path as company_logo 
+        FROM jobs j 
+        JOIN companies c ON j.company_id = c.id 
+        WHERE j.change_seq > ? 
+        ORDER BY j.change_seq 
+        LIMIT ?
+    ''', (since, SYNC_PAGE_SIZE)).fetchall()
+    
+    has_more = len(rows) == SYNC_PAGE_SIZE
+    token = rows[-1]['change_seq'] if has_more else current
+    
+    # عند إعادة التحميل الكاملة لا حاجة لسجلات الحذف ولا للوظائف الموقوفة
+    deleted = [] if reset else [row['job_id'] for row in conn.execute(
+        'SELECT job_id FROM job_tombstones WHERE change_seq > ? AND change_seq <= ? ORDER BY change_seq',
+        (since, token))]
+    conn.close()
+    
+    jobs_list = []
+    for row in rows:
+        if not row['is_active']:
+            if not reset:
+                deleted.append(row['id'])
+            continue
+        job = dict(row)
+        job['company_logo'] = logo_urls(job['company_logo'])
+        jobs_list.append(job)
+    
+    meta = {'token': str(token), 'reset': reset, 'has_more': has_more}
+    
+    if output == 'msgpack':
+        body = msgpack.packb({**meta, 'jobs': jobs_list, 'deleted': deleted})
+        return compressed_response(body, 'application/x-msgpack')
+    if output == 'ndjson':
+        # السطر الأول بيانات المزامنة ثم وظيفة أو سجل حذف في كل سطر
+        lines = [json.dumps(meta, ensure_ascii=False)]
+        lines += [json.dumps(job, ensure_ascii=False) for job in jobs_list]
+        lines += [json.dumps({'id': job_id, 'deleted': True}) for job_id in deleted]
+        return compressed_response('\n'.join(lines) + '\n', 'application/x-ndjson')
+    return compressed_response(json.dumps({**meta, 'jobs': jobs_list, 'deleted': deleted}, 
+                                          ensure_ascii=False), 'application/json')
+
+LOCATIONS_JSON = json.dumps(locations_list(), ensure_ascii=False)
+LOCATIONS_ETAG = hashlib.sha256(LOCATIONS_JSON.encode('utf-8')).hexdigest()[:16]
+
+@app.route('/api/locations', methods=['GET'])
+def api_locations():
+    """دليل المواقع للتطبيق - ثابت فيُخزن مؤقتاً مع ETag"""
+    response = app.response_class(LOCATIONS_JSON, mimetype='application/json')
+    response.set_etag(LOCATIONS_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 24 * 60 * 60
+    return response.make_conditional(request)
+
+@app.route('/api/suggest')
+@limiter.limit("300 per minute")
+def api_suggest():
+    """اقتراحات مربع البحث (عناوين، شركات، مواقع) مرتبة حسب عدد الوظائف النشطة"""
+    if suggest_index.needs_check():
+        suggest.refresh_index(get_db_connection, suggest_index)
+    
+    q = request.args.get('q', '')[:100]
+    limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), suggest.MAX_LIMIT)
+    
+    suggestions = []
+    for kind, text, item_id, count in suggest_index.suggest(q, limit):
+        if kind == 'location':
+            url = url_for('jobs', location=text)
+        else:
+            url = url_for('jobs', q=text)
+        suggestions.append({'type': kind, 'text': text, 'id': item_id, 'count': count, 'url': url})
+    
+    response = jsonify({'query': q, 'suggestions': suggestions})
+    response.headers['Cache-Control'] = f'public, max-age={SUGGEST_REFRESH_SECONDS}'
+    return response
+
+# ==============================
+# 🔔 تنبيهات الوظائف
+# ==============================
+
+def create_saved_search(data):
+    """إنشاء بحث محفوظ من بيانات نموذج أو JSON - يعيد (token, رسالة خطأ)"""
+    email = normalize_email(data.get('email'))
+    if not re.match(r'^[^@\s]+@[^@\s]+\.[^@\s]+$', email):
+        return None, 'يرجى إدخال بريد إلكتروني صحيح'
+    
+    search = {
+        'category': (data.get('category') or '').strip() or None,
+        'job_type': (data.get('type') or data.get('job_type') or '').strip() or None,
+        'location': (data.get('location') or '').strip() or None,
+        'keywords': (data.get('keywords') or '').strip() or None,
+    }
+    if not any(search.values()):
+        return None, 'يرجى تحديد معيار واحد على الأقل للتنبيه'
+    
+    token = secrets.token_urlsafe(16)
+    confirm_token = secrets.token_urlsafe(24)
+    conn = get_db_connection()
+    # غير مفعل حتى يضغط صاحب البريد رابط التأكيد - لا يمكن تسجيل بريد شخص آخر في الملخصات
+    conn.execute('''INSERT INTO saved_searches (email, token, confirm_token, is_active, 
+                                               category, job_type, location, location_id, keywords) 
+                    VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?)''',
+                 (email, token, confirm_token, search['category'], search['job_type'], search['location'],
+                  resolve_location(search['location']), search['keywords']))
+    outbox = alerts.get_outbox(app.config['ALERT_OUTBOX'], conn, app.config['ALERT_OUTBOX_FILE'])
+    alerts.send_confirmation(outbox, email,
+                             url_for('confirm_alert', confirm_token=confirm_token, _external=True),
+                             url_for('delete_alert', token=token, _external=True))
+    conn.commit()
+    conn.close()
+    return token, None
+
+def confirm_saved_search(confirm_token):
+    conn = get_db_connection()
+    cur = conn.execute('''UPDATE saved_searches SET is_active = 1, confirm_token = NULL 
+                          WHERE confirm_token = ?''', (confirm_token,))
+    conn.commit()
+    if cur.rowcount:
+        alerts.refresh_index(conn, saved_search_index)
+    conn.close()
+    return cur.rowcount > 0
+
+def deactivate_saved_search(token):
+    conn = get_db_connection()
+    row = conn.execute('''SELECT id FROM saved_searches 
+                          WHERE token = ? AND (is_active = 1 OR confirm_token IS NOT NULL)''', 
+                       (token,)).fetchone()
+    if row:
+        conn.execute('UPDATE saved_searches SET is_active = 0, confirm_token = NULL WHERE id = ?', (row['id'],))
+        conn.commit()
+        saved_search_index.remove(row['id'])
+    conn.close()
+    return row is not None
+
+@app.route('/alerts', methods=['POST'])
+@limiter.limit("10 per hour")
+def create_alert():
+    token, error = create_saved_search(request.form)
+    if error:
+        flash(error, 'error')
+    else:
+        flash('تم حفظ التنبيه! أرسلنا رابط تأكيد إلى بريدك لتفعيله.', 'success')
+    return redirect(url_for('jobs', category=request.form.get('category', ''),
+                            type=request.form.get('type', ''), location=request.form.get('location', '')))
+
+@app.route('/alerts/confirm/<confirm_token>')
+def confirm_alert(confirm_token):
+    if confirm_saved_search(confirm_token):
+        flash('تم تفعيل التنبيه! سنراسلك عند نشر وظائف مطابقة.', 'success')
+    else:
+        flash('رابط التأكيد غير صالح أو مستخدم مسبقاً', 'error')
+    return redirect(url_for('jobs'))
+
+@app.route('/alerts/<token>/delete', methods=['GET', 'POST'])
+def delete_alert(token):
+    if deactivate_saved_search(token):
+        flash('تم إلغاء التنبيه', 'success')
+    else:
+        flash('التنبيه غير موجود', 'error')
+    return redirect(url_for('jobs'))
+
+@app.route('/api/alerts', methods=['POST'])
+@limiter.limit("10 per hour")
+def api_create_alert():
+    token, error = create_saved_search(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'error': error}), 400
+    return jsonify({'success': True, 'token': token, 'pending_confirmation': True}), 201
+
+@app.route('/api/alerts/<token>', methods=['DELETE'])
+def api_delete_alert(token):
+    if not deactivate_saved_search(token):
+        return jsonify({'error': 'التنبيه غير موجود'}), 404
+    return jsonify({'success': True})
+
 @app.route('/api/upload', methods=['POST'])
 @limiter.limit("10 per minute")
 def api_upload():
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()[:255]
+    
+    # حجز المفتاح أولاً: إعادة المحاولة أثناء رفع الطلب الأصلي لا تقرأ الملفات أو تحفظها مرة ثانية
+    if idempotency_key:
+        saved = claim_idempotency_key(idempotency_key)
+        if saved and saved['status_code'] is None:
+            response = jsonify({'error': 'الطلب الأصلي ما زال قيد المعالجة، أعد المحاولة بعد قليل'})
+            response.status_code = 409
+            response.headers['Retry-After'] = '5'
+            return response
+        if saved:
+            response = app.response_class(saved['response'], status=saved['status_code'], 
+                                          mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+    
+    response = None
+    try:
+        response = app.make_response(save_application(idempotency_key))
+    finally:
+        if idempotency_key and (response is None or response.status_code != 201):
+            release_idempotency_key(idempotency_key)
+    return response
+
+def save_application(idempotency_key):
+    """معالجة طلب /api/upload بعد حجز مفتاح Idempotency-Key (إن وُجد)"""
+    # إذا أرسل التطبيق job_id في الرابط والبريد في الترويسة نتحقق قبل قراءة جسم الطلب
+    # (البريد لا يوضع في الرابط حتى لا يظهر في سجلات الخوادم)
+    applicant_email = request.headers.get('X-Applicant-Email', '').strip()
+    early_job_id = request.args.get('job_id', type=sqlite_int)
+    if early_job_id is not None and applicant_email:
+        conn = get_db_connection()
+        existing_id = find_existing_application(conn, early_job_id, applicant_email)
+        conn.close()
+        if existing_id:
+            return jsonify({'error': 'لقد تقدمت لهذه الوظيفة مسبقاً', 'applicant_id': existing_id}), 409
+    
     try:
         full_name = request.form.get('full_name')
         email = request.form.get('email')
         phone = request.form.get('phone')
-        job_id = request.form.get('job_id')
+        job_id = request.form.get('job_id', type=sqlite_int)
         cover_letter = request.form.get('cover_letter')
 
         if not full_name or not email:
             return jsonify({'error': 'يرجى إدخال الاسم والبريد الإلكتروني'}), 400
 
+        conn = get_db_connection()
+        job = conn.execute('SELECT id, company_id, title FROM jobs WHERE id = ? AND is_active = 1', 
+                           (job_id,)).fetchone()
+        if not job:
+            conn.close()
+            return jsonify({'error': 'الوظيفة غير متاحة'}), 404
+        
+        existing_id = find_existing_application(conn, job_id, email)
+        conn.close()
+        if existing_id:
+            return jsonify({'error': 'لقد تقدمت لهذه الوظيفة مسبقاً', 'applicant_id': existing_id}), 409
+
         cv_file = request.files.get('cv')
         video_file = request.files.get('intro_video')
 
-        cv_path = None
-        video_path = None
-
-        # رفع السيرة الذاتية
+        # التحقق من الملفين قبل حفظ أي منهما
         if cv_file and cv_file.filename:
-            filename = secure_filename(cv_file.filename)
-            if not allowed_file(filename, ALLOWED_CV):
+            cv_filename = secure_filename(cv_file.filename)
+            if not allowed_file(cv_filename, ALLOWED_CV):
                 return jsonify({'error': 'نوع السيرة الذاتية غير مدعوم'}), 400
             
             cv_file.seek(0, os.SEEK_END)
             if cv_file.tell() > MAX_CV_SIZE:
                 return jsonify({'error': 'حجم السيرة الذاتية كبير (5MB كحد أقصى)'}), 400
             cv_file.seek(0)
-            
-            save_name = f"cv_{int(datetime.now().timestamp())}_{filename}"
-            save_path = os.path.join(app.config['CV_FOLDER'], save_name)
-            cv_file.save(save_path)
-            cv_path = f"/uploads/cvs/{save_name}"
 
-        # رفع الفيديو
         if video_file and video_file.filename:
-            filename = secure_filename(video_file.filename)
-            if not allowed_file(filename, ALLOWED_VIDEO):
+            video_filename = secure_filename(video_file.filename)
+            if not allowed_file(video_filename, ALLOWED_VIDEO):
                 return jsonify({'error': 'نوع الفيديو غير مدعوم'}), 400
             
             video_file.seek(0, os.SEEK_END)
             if video_file.tell() > MAX_VIDEO_SIZE:
                 return jsonify({'error': 'حجم الفيديو كبير (60MB كحد أقصى)'}), 400
             video_file.seek(0)
-            
-            save_name = f"video_{int(datetime.now().timestamp())}_{filename}"
-            save_path = os.path.join(app.config['VIDEO_FOLDER'], save_name)
-            video_file.save(save_path)
-            video_path = f"/uploads/videos/{save_name}"
+
+        cv_path = None
+        video_path = None
+        saved_files = []
+
+        # ملفات رُفعت مسبقاً مباشرة إلى التخزين عبر /api/upload/presign
+        direct_keys = []
+        cv_key = request.form.get('cv_key') if not (cv_file and cv_file.filename) else None
+        video_key = request.form.get('video_key') if not (video_file and video_file.filename) else None
+        if (cv_key or video_key) and not upload_storage.direct_uploads:
+            return jsonify({'error': 'الرفع المباشر غير متاح - أرسل الملفات مع الطلب'}), 400
+        if cv_key or video_key:
+            conn = get_db_connection()
+            try:
+                if cv_key:
+                    cv_path, error = direct_upload_path(conn, cv_key, job_id, 'cvs', ALLOWED_CV, MAX_CV_SIZE)
+                    if error:
+                        return jsonify({'error': error}), 400
+                    direct_keys.append(cv_key)
+                if video_key:
+                    video_path, error = direct_upload_path(conn, video_key, job_id, 'videos',
+                                                           ALLOWED_VIDEO, MAX_VIDEO_SIZE)
+                    if error:
+                        return jsonify({'error': error}), 400
+                    direct_keys.append(video_key)
+            finally:
+                conn.close()
+
+        # رفع السيرة الذاتية
+        if cv_file and cv_file.filename:
+            cv_path = store_upload(cv_file, 'cvs', 'cv', cv_filename)
+            saved_files.append(upload_url_to_key(cv_path))
+
+        # رفع الفيديو
+        if video_file and video_file.filename:
+            video_path = store_upload(video_file, 'videos', 'video', video_filename)
+            saved_files.append(upload_url_to_key(video_path))
 
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute('''INSERT INTO applicants (job_id, full_name, email, phone, cv_path, video_path, cover_letter) 
-                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    (job_id, full_name, email, phone, cv_path, video_path, cover_letter))
-        conn.commit()
+        try:
+            cur.execute('''INSERT INTO applicants (job_id, full_name, email, email_normalized, phone, 
+                                                   cv_path, video_path, cover_letter) 
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                        (job_id, full_name, email, normalize_email(email), phone, 
+                         cv_path, video_path, cover_letter))
+        except sqlite3.IntegrityError:
+            # طلب متزامن بنفس البريد سبقنا إلى الإدراج
+            conn.close()
+            for key in saved_files:
+                upload_storage.delete(key)
+            return jsonify({'error': 'لقد تقدمت لهذه الوظيفة مسبقاً'}), 409
+        if not claim_direct_uploads(conn, direct_keys):
+            # طلب متزامن استخدم نفس المفتاح - إغلاق الاتصال يلغي الإدراج
+            conn.close()
+            for key in saved_files:
+                upload_storage.delete(key)
+            return jsonify({'error': 'الملف مستخدم في طلب آخر'}), 409
         applicant_id = cur.lastrowid
-        conn.close()
-
-        return jsonify({
+        log_company_event(conn, job['company_id'], 'applicant', {
+            'applicant_id': applicant_id,
+            'job_id': job_id,
+            'job_title': job['title'],
+            'full_name': full_name,
+            'status': APPLICANT_STATUSES[0]
+        })
+
+        body = {
             'success': True,
             'message': 'تم تقديم طلبك بنجاح! سنقوم بمراجعته قريباً.', 
             'cv': cv_path, 
             'video': video_path,
             'applicant_id': applicant_id
-        }), 201
+        }
+        if idempotency_key:
+            conn.execute('''UPDATE idempotency_keys SET status_code = ?, response = ?, 
+                                   expires_at = datetime('now', ?) WHERE key = ?''',
+                         (201, json.dumps(body, ensure_ascii=False), 
+                          f'+{IDEMPOTENCY_TTL_HOURS} hours', idempotency_key))
+        conn.commit()
+        conn.close()
+
+        job_events.record(job_id, 'apply_success')
+        return jsonify(body), 201
 
     except Exception as e:
         return jsonify({'error': f'حدث خطأ أثناء معالجة الطلب: {str(e)}'}), 500
 
+@app.route('/api/upload/presign', methods=['POST'])
+@limiter.limit("20 per minute")
+def api_upload_presign():
+    """رابط رفع مباشر إلى التخزين حتى لا تمر الملفات الكبيرة عبر الخادم"""
+    data = request.get_json(silent=True) or {}
+    kinds = {
+        'cv': ('cvs', ALLOWED_CV, MAX_CV_SIZE),
+        'video': ('videos', ALLOWED_VIDEO, MAX_VIDEO_SIZE),
+    }
+    if data.get('kind') not in kinds:
+        return jsonify({'error': 'نوع الملف يجب أن يكون cv أو video'}), 400
+    folder, allowed, max_size = kinds[data['kind']]
+    
+    filename = secure_filename(data.get('filename') or '')
+    if not allowed_file(filename, allowed):
+        return jsonify({'error': 'نوع الملف غير مدعوم'}), 400
+    
+    if not upload_storage.direct_uploads:
+        return jsonify({'error': 'الرفع المباشر غير متاح - استخدم /api/upload'}), 501
+    
+    # المفتاح مربوط بوظيفة نشطة ويُقبل في /api/upload لنفس الوظيفة فقط
+    job_id = data.get('job_id')
+    if isinstance(job_id, str) and job_id.isdecimal():
+        job_id = int(job_id)
+    if not isinstance(job_id, int) or isinstance(job_id, bool) or not 0 < job_id <= SQLITE_INT_MAX:
+        return jsonify({'error': 'الوظيفة غير متاحة'}), 404
+    conn = get_db_connection()
+    if not conn.execute('SELECT 1 FROM jobs WHERE id = ? AND is_active = 1', (job_id,)).fetchone():
+        conn.close()
+        return jsonify({'error': 'الوظيفة غير متاحة'}), 404
+    
+    key = f"{folder}/{data['kind']}_{int(datetime.now().timestamp())}_{secrets.token_hex(8)}_{filename}"
+    content_type = data.get('content_type') or 'application/octet-stream'
+    upload = upload_storage.presigned_upload(key, content_type, max_size)
+    conn.execute('''INSERT INTO direct_uploads (key, job_id, expires_at) 
+                    VALUES (?, ?, datetime('now', ?))''', (key, job_id, f'+{DIRECT_UPLOAD_CLAIM_HOURS} hours'))
+    conn.commit()
+    conn.close()
+    
+    return jsonify({
+        'key': key,
+        'url': upload['url'],
+        'fields': upload['fields'],
+        'max_size': max_size,
+        # يُرسل المفتاح بعد الرفع إلى /api/upload باسم cv_key أو video_key مع نفس job_id
+        'field': f"{data['kind']}_key",
+        'expires_in_hours': DIRECT_UPLOAD_CLAIM_HOURS
+    })
+
 @app.route('/upload_cv', methods=['POST'])
 @limiter.limit("20 per minute")
 def upload_cv():
@@ -649,13 +2026,9 @@ def upload_cv():
         return jsonify({'error': 'حجم الملف كبير (5MB كحد أقصى)'}), 400
     file.seek(0)
 
-    save_name = f"cv_{int(datetime.now().timestamp())}_{filename}"
-    save_path = os.path.join(app.config['CV_FOLDER'], save_name)
-    file.save(save_path)
-
     return jsonify({
         'message': 'تم رفع السيرة الذاتية بنجاح ✅',
-        'path': f"/uploads/cvs/{save_name}"
+        'path': store_upload(file, 'cvs', 'cv', filename)
     }), 200
 
 @app.route('/upload_video', methods=['POST'])
@@ -674,13 +2047,9 @@ def upload_video():
         return jsonify({'error': 'حجم الفيديو كبير (60MB كحد أقصى)'}), 400
     file.seek(0)
 
-    save_name = f"video_{int(datetime.now().timestamp())}_{filename}"
-    save_path = os.path.join(app.config['VIDEO_FOLDER'], save_name)
-    file.save(save_path)
-
     return jsonify({
         'message': 'تم رفع الفيديو بنجاح 🎥',
-        'path': f"/uploads/videos/{save_name}"
+        'path': store_upload(file, 'videos', 'video', filename)
     }), 200
 
 # ==============================
@@ -734,13 +2103,52 @@ def mobile_apply_app():
 # 🗂️ خدمة الملفات
 # ==============================
 
+def serve_upload(folder, filename):
+    # مع S3 يتم التحويل إلى رابط مؤقت فيُحمل الملف من التخزين مباشرة
+    key = upload_url_to_key(f'/uploads/{folder}/{filename}')
+    if not key:
+        return '', 404
+    download_url = upload_storage.download_url(key, filename)
+    if download_url:
+        response = redirect(download_url)
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    return send_from_directory(os.path.join(app.config['UPLOAD_FOLDER'], folder), filename)
+
 @app.route('/uploads/cvs/<path:filename>')
 def uploaded_cv(filename):
-    return send_from_directory(app.config['CV_FOLDER'], filename)
+    return serve_upload('cvs', filename)
 
 @app.route('/uploads/videos/<path:filename>')
 def uploaded_video(filename):
-    return send_from_directory(app.config['VIDEO_FOLDER'], filename)
+    return serve_upload('videos', filename)
+
+LOGO_NAME_RE = re.compile(r'^(\d+_[0-9a-f]{16})_(%s)\.(%s)$' % ('|'.join(LOGO_VARIANTS), '|'.join(LOGO_FORMATS)))
+
+@app.route('/logos/<filename>')
+def company_logo(filename):
+    """نسخ الشعارات - الروابط مبنية على المحتوى فيتم تخزينها مؤقتاً بشكل دائم"""
+    match = LOGO_NAME_RE.match(filename)
+    if not match:
+        return '', 404
+    
+    # توليد النسخة عند الطلب إذا لم تكن موجودة (مثلاً بعد إضافة مقاس جديد)
+    if not upload_storage.exists(f"logos/{filename}"):
+        key, variant, fmt = match.groups()
+        if not upload_storage.exists(f"logos/{key}_original"):
+            return '', 404
+        render_logo_variant(key, variant, fmt)
+    
+    if upload_storage.local_path(f"logos/{filename}"):
+        response = send_from_directory(app.config['COMPANY_LOGOS'], filename, max_age=LOGO_CACHE_SECONDS)
+    else:
+        # الشعارات صغيرة: تُقدم من التخزين مباشرة بدلاً من رابط مؤقت ينتهي قبل مدة التخزين المؤقت
+        with closing(upload_storage.open(f"logos/{filename}")) as src:
+            response = app.response_class(src.read(), mimetype=f"image/{match.group(3)}")
+        response.cache_control.max_age = LOGO_CACHE_SECONDS
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 # ==============================
 # 📈 إحصائيات API
@@ -844,6 +2252,9 @@ def test_page():
             'login': '/company/login',
             'register': '/company/register',
             'api_stats': '/api/stats',
+            'api_locations': '/api/locations',
+            'api_jobs_sync': '/api/jobs/sync',
+            'api_suggest': '/api/suggest?q=',
             'mobile_apply': '/mobile/apply',
             'mobile_apply_app': '/mobile/apply/app',
             'test': '/test'
@@ -0,0 +1,125 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+try:
+    from gevent import get_hub
+    from gevent.monkey import is_module_patched
+except ImportError:  # بدون gevent (عمال sync أو خادم التطوير)
+    get_hub = None
+
+# ==============================
+# 📡 بث أحداث لوحة الشركة داخل العامل
+# ==============================
+#
+# فاحص واحد لكل عملية يقرأ الجديد من company_events كل فترة ويوزعه على طوابير
+# اتصالات SSE المفتوحة لنفس الشركة، بدلاً من استعلام لكل متصفح مفتوح. يعمل فقط
+# ما دام هناك مشترك، ويبدأ من آخر حدث عند أول اشتراك.
+#
+# داخل عامل gevent كل الاتصالات تعمل في خيط نظام واحد، فأي انتظار لقفل SQLite أو
+# معالجة صور بـ Pillow يوقفها جميعاً. run_blocking ينفذ هذه الأعمال في مجمع خيوط
+# gevent (خيوط حقيقية) بينما تستمر بقية الاتصالات - انظر gunicorn.conf.py.
+
+
+def run_blocking(func, *args):
+    """تنفيذ عمل يحجز المعالج أو ينتظر SQLite خارج حلقة gevent (أو مباشرة بدونها)"""
+    if get_hub is not None and is_module_patched('threading'):
+        return get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
+class EventHub:
+
+    def __init__(self, connect, poll_seconds=2, retention_days=7, prune_seconds=3600, batch_size=500):
+        self._connect = connect
+        self._poll_seconds = poll_seconds
+        self._retention_days = retention_days
+        self._prune_seconds = prune_seconds
+        self._batch_size = batch_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._last_id = None
+        self._pruned_at = 0
+
+    def subscribe(self, company_id):
+        """طابور لأحداث الشركة - يعيد (الطابور, آخر معرف قبل الاشتراك)؛ ما بعده يصل عبر الطابور"""
+        events = queue.Queue()
+        with self._lock:
+            if self._running():
+                self._subscribers[company_id].add(events)
+                return events, self._last_id
+
+        start_id = run_blocking(self._max_id)
+        with self._lock:
+            if not self._running():
+                # أول مشترك في هذه العملية (بعد fork في gunicorn أو بعد توقف الفاحص)
+                self._subscribers.clear()
+                self._last_id = start_id
+                self._thread_pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='company-events', daemon=True)
+                self._thread.start()
+            self._subscribers[company_id].add(events)
+            return events, self._last_id
+
+    def _running(self):
+        return self._thread is not None and self._thread_pid == os.getpid()
+
+    def unsubscribe(self, company_id, events):
+        with self._lock:
+            subscribers = self._subscribers.get(company_id)
+            if subscribers is not None:
+                subscribers.discard(events)
+                if not subscribers:
+                    del self._subscribers[company_id]
+
+    def _max_id(self):
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM company_events').fetchone()[0]
+        finally:
+            conn.close()
+
+    def _fetch(self, after_id):
+        conn = self._connect()
+        try:
+            rows = conn.execute('''SELECT id, company_id, event_type, payload FROM company_events
+                                   WHERE id > ? ORDER BY id LIMIT ?''', (after_id, self._batch_size)).fetchall()
+            if time.monotonic() - self._pruned_at >= self._prune_seconds:
+                self._pruned_at = time.monotonic()
+                with conn:
+                    conn.execute("DELETE FROM company_events WHERE created_at < datetime('now', ?)",
+                                 (f'-{self._retention_days} days',))
+            return rows
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # لا مشتركين: يتوقف الفاحص ويبدأ من جديد مع الاشتراك التالي
+                    self._thread = None
+                    self._last_id = None
+                    return
+                after_id = self._last_id
+
+            try:
+                rows = run_blocking(self._fetch, after_id)
+            except sqlite3.Error:
+                # قاعدة البيانات مشغولة: نعيد المحاولة في الدورة التالية
+                rows = []
+
+            with self._lock:
+                for row in rows:
+                    for events in self._subscribers.get(row['company_id'], ()):
+                        events.put(row)
+                if rows:
+                    self._last_id = rows[-1]['id']
+
+            if len(rows) < self._batch_size:
+                time.sleep(self._poll_seconds)
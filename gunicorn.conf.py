@@ -0,0 +1,38 @@
+# ==============================
+# 🚀 إعدادات gunicorn
+# ==============================
+#
+# يتم تحميل هذا الملف تلقائياً عند تشغيل `gunicorn app:app` من مجلد المشروع.
+#
+# مسار /company/events (بث SSE للوحة تحكم الشركة) يبقي الاتصال مفتوحاً لدقائق.
+# مع العمال المتزامنين (sync) يحجز كل متصفح مفتوح عاملاً كاملاً، لذلك نستخدم
+# عمال gevent: كل عامل يخدم مئات الاتصالات الخاملة في نفس الوقت.
+#
+# للتشغيل المحلي بدون gevent:  GUNICORN_WORKER_CLASS=sync gunicorn app:app
+#
+# المقابل: كل اتصالات العامل تعمل في خيط نظام واحد، فأي عمل يحجز المعالج أو ينتظر
+# خارج الشبكة يوقفها جميعاً (بما فيها البث). لذلك:
+#   - معالجة الشعارات بـ Pillow وفاحص الأحداث (استعلام واحد لكل عامل يوزع على كل
+#     اتصالات SSE) تعمل في مجمع خيوط gevent عبر events.run_blocking
+#   - قاعدة البيانات بوضع WAL فلا تنتظر القراءات الكتابة، ويبقى انتظار كاتب لكاتب
+#     آخر (عادة أجزاء من الثانية) داخل الحلقة
+#   - باقي استعلامات الطلبات العادية قصيرة ومفهرسة وتعمل مباشرة في الحلقة؛ أي عمل
+#     ثقيل جديد (تقارير، تصدير كبير) يجب أن يمر عبر run_blocking
+# إذا أصبح ذلك غير كافٍ: خدمة gevent منفصلة لمسار /company/events فقط، والموقع
+# بعمال متعددي الخيوط (GUNICORN_WORKER_CLASS=gthread) مع timeout أعلى.
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# أقصى عدد اتصالات متزامنة لكل عامل gevent (تشمل اتصالات SSE الخاملة)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# اتصال SSE يُغلق من الخادم بعد EVENTS_STREAM_SECONDS (300 ثانية) ثم يعيد المتصفح
+# الاتصال، فيجب أن تكون المهلة أطول منه مع العمال المتزامنين
+timeout = 330 if worker_class == 'sync' else 30
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,193 @@
+import re
+
+# ==============================
+# 🗺️ دليل المواقع اليمنية (المحافظات والمدن)
+# ==============================
+
+# المحافظات: (المعرف, الاسم, الاسم بالإنجليزية, أسماء بديلة)
+GOVERNORATES = [
+    (1, 'أمانة العاصمة', 'Amanat Al Asimah', ['صنعاء', 'صنعا', 'مدينة صنعاء', 'العاصمة', 'Sanaa', "Sana'a", 'Sana', 'Sanaa City']),
+    (2, 'محافظة صنعاء', 'Sanaa Governorate', ['محافظة صنعا', 'Sanaa Governorate']),
+    (3, 'عدن', 'Aden', ['Adan']),
+    (4, 'تعز', 'Taiz', ["Ta'izz", 'Taizz', 'Taiz City']),
+    (5, 'الحديدة', 'Al Hudaydah', ['الحديده', 'حديدة', 'Hodeidah', 'Hudaydah', 'Hodeida']),
+    (6, 'إب', 'Ibb', ['اب']),
+    (7, 'ذمار', 'Dhamar', ['Thamar']),
+    (8, 'حضرموت', 'Hadramaut', ['Hadramawt', 'Hadhramaut', 'Hadramout']),
+    (9, 'المهرة', 'Al Mahrah', ['المهره', 'Mahra', 'Mahrah']),
+    (10, 'شبوة', 'Shabwah', ['شبوه', 'Shabwa']),
+    (11, 'أبين', 'Abyan', []),
+    (12, 'لحج', 'Lahij', ['Lahej', 'Lahj']),
+    (13, 'الضالع', 'Ad Dali', ['Dhale', "Al Dhale'e", 'Al Dhale', 'Dala']),
+    (14, 'البيضاء', 'Al Bayda', ['البيضا', 'Bayda', 'Al Baydha', 'Baidha']),
+    (15, 'مأرب', 'Marib', ['مارب', "Ma'rib"]),
+    (16, 'الجوف', 'Al Jawf', ['Jawf', 'Al Jouf']),
+    (17, 'صعدة', 'Saada', ['صعده', "Sa'dah", 'Sadah']),
+    (18, 'حجة', 'Hajjah', ['حجه', 'Hajja']),
+    (19, 'المحويت', 'Al Mahwit', ['Mahweet', 'Al Mahweet']),
+    (20, 'عمران', 'Amran', []),
+    (21, 'ريمة', 'Raymah', ['ريمه', 'Raima', 'Rayma']),
+    (22, 'سقطرى', 'Socotra', ['سقطره', 'Soqotra', 'Suqutra']),
+]
+
+# المدن: (المعرف, الاسم, الاسم بالإنجليزية, معرف المحافظة, أسماء بديلة)
+CITIES = [
+    (101, 'المكلا', 'Mukalla', 8, ['Al Mukalla']),
+    (102, 'سيئون', 'Seiyun', 8, ['سيؤون', 'Sayun', 'Seiyoun']),
+    (103, 'تريم', 'Tarim', 8, []),
+    (104, 'الشحر', 'Ash Shihr', 8, ['Shihr']),
+    (105, 'الغيضة', 'Al Ghaydah', 9, ['الغيظة', 'Ghaydah', 'Al Ghaidah']),
+    (106, 'عتق', 'Ataq', 10, []),
+    (107, 'زنجبار', 'Zinjibar', 11, []),
+    (108, 'الحوطة', 'Al Houta', 12, ['Houta', 'Al Hawtah']),
+    (109, 'المخا', 'Mocha', 4, ['Mokha', 'Al Mukha']),
+    (110, 'التربة', 'At Turbah', 4, ['Turbah']),
+    (111, 'زبيد', 'Zabid', 5, []),
+    (112, 'باجل', 'Bajil', 5, []),
+    (113, 'يريم', 'Yarim', 6, []),
+    (114, 'جبلة', 'Jibla', 6, []),
+    (115, 'رداع', "Rada'a", 14, ['Rada', 'Radaa']),
+    (116, 'حرض', 'Haradh', 18, []),
+    (117, 'بيحان', 'Bayhan', 10, ['Beihan']),
+    (118, 'حديبو', 'Hadibu', 22, ['Hadiboh']),
+    (119, 'المعلا', 'Al Mualla', 3, ['Mualla']),
+    (120, 'كريتر', 'Crater', 3, []),
+]
+
+# المحافظات المتجاورة (تكفي جهة واحدة - يتم استكمال التناظر تلقائياً)
+ADJACENT_GOVERNORATES = {
+    1: [2],
+    2: [5, 7, 14, 15, 19, 20, 21],
+    3: [11, 12],
+    4: [5, 6, 12, 13],
+    5: [6, 7, 18, 19, 21],
+    6: [7, 13, 14],
+    7: [14, 21],
+    8: [9, 10, 15, 16],
+    10: [11, 14, 15],
+    11: [12, 13, 14],
+    12: [13],
+    13: [14],
+    14: [15],
+    15: [16],
+    16: [17, 20],
+    17: [18, 20],
+    18: [19, 20],
+    19: [20],
+}
+
+# ==============================
+# 🔤 توحيد النصوص العربية
+# ==============================
+
+_TASHKEEL_RE = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي', 'ء': '',
+    'ʼ': '', "'": '', '`': '', '’': '',
+})
+_NON_WORD_RE = re.compile(r'[^\w]+')
+_ARTICLE_RE = re.compile(r'^(ال|al |as |ad |at |ash )')
+
+
+def normalize_arabic(text):
+    """توحيد الحروف العربية واللاتينية للمقارنة (الهمزات، التاء المربوطة، التشكيل...)"""
+    if not text:
+        return ''
+    text = _TASHKEEL_RE.sub('', text.strip().lower()).translate(_LETTER_MAP)
+    return ' '.join(_NON_WORD_RE.sub(' ', text).split())
+
+
+def strip_article(text):
+    """حذف "ال" التعريف (أو Al) من بداية نص موحد (المحاسب -> محاسب)"""
+    return _ARTICLE_RE.sub('', text)
+
+
+# ==============================
+# 📍 البحث في الدليل
+# ==============================
+
+LOCATIONS = {}
+for _id, _name, _name_en, _aliases in GOVERNORATES:
+    LOCATIONS[_id] = {'id': _id, 'name': _name, 'name_en': _name_en,
+                      'parent_id': None, 'aliases': _aliases}
+for _id, _name, _name_en, _parent, _aliases in CITIES:
+    LOCATIONS[_id] = {'id': _id, 'name': _name, 'name_en': _name_en,
+                      'parent_id': _parent, 'aliases': _aliases}
+
+_ALIASES = {}
+for _loc in LOCATIONS.values():
+    for _alias in [_loc['name'], _loc['name_en'], *_loc['aliases']]:
+        _ALIASES.setdefault(normalize_arabic(_alias), _loc['id'])
+        # بدون "ال" التعريف أو "Al"
+        _bare = strip_article(normalize_arabic(_alias))
+        _ALIASES.setdefault(_bare, _loc['id'])
+
+_CHILDREN = {}
+for _loc in LOCATIONS.values():
+    if _loc['parent_id']:
+        _CHILDREN.setdefault(_loc['parent_id'], []).append(_loc['id'])
+
+_NEIGHBOURS = {gov_id: set() for gov_id, *_ in GOVERNORATES}
+for _gov, _adjacent in ADJACENT_GOVERNORATES.items():
+    for _other in _adjacent:
+        _NEIGHBOURS[_gov].add(_other)
+        _NEIGHBOURS[_other].add(_gov)
+
+_SEPARATORS_RE = re.compile(r'[,،\-/|()]+')
+
+
+def resolve_location(text):
+    """تحويل نص الموقع الحر إلى معرف في الدليل - أو None إذا لم يتم التعرف عليه"""
+    if not text:
+        return None
+    location_id = _ALIASES.get(normalize_arabic(text))
+    if location_id:
+        return location_id
+
+    # "المكلا - حضرموت" أو "صنعاء، شارع الزبيري": نأخذ أدق جزء معروف
+    matches = [_ALIASES.get(normalize_arabic(part)) for part in _SEPARATORS_RE.split(text)]
+    matches = [m for m in matches if m]
+    if not matches:
+        return None
+    return max(matches, key=lambda m: LOCATIONS[m]['parent_id'] is not None)
+
+
+def governorate_of(location_id):
+    location = LOCATIONS.get(location_id)
+    if not location:
+        return None
+    return location['parent_id'] or location['id']
+
+
+def expand_location(location_id, nearby=False):
+    """المعرفات المطابقة لموقع: المدينة نفسها، أو المحافظة ومدنها (+ المحافظات المجاورة)"""
+    location = LOCATIONS.get(location_id)
+    if not location:
+        return []
+    if location['parent_id'] and not nearby:
+        return [location_id]
+
+    governorates = {governorate_of(location_id)}
+    if nearby:
+        governorates |= _NEIGHBOURS[governorate_of(location_id)]
+
+    ids = set(governorates)
+    for gov_id in governorates:
+        ids.update(_CHILDREN.get(gov_id, []))
+    return sorted(ids)
+
+
+def locations_list():
+    """قائمة الدليل بصيغة مناسبة للـ API"""
+    return [
+        {
+            'id': loc['id'],
+            'name': loc['name'],
+            'name_en': loc['name_en'],
+            'parent_id': loc['parent_id'],
+            'aliases': loc['aliases'],
+            'nearby': sorted(_NEIGHBOURS[loc['id']]) if not loc['parent_id'] else [],
+        }
+        for loc in sorted(LOCATIONS.values(), key=lambda l: l['id'])
+    ]
@@ -0,0 +1,129 @@
+import re
+
+# ==============================
+# 💰 تحليل نطاق الراتب النصي
+# ==============================
+
+DEFAULT_CURRENCY = 'YER'
+CURRENCIES = ['YER', 'USD', 'SAR']
+
+# الترتيب مهم: "ريال سعودي" قبل "ريال"
+_CURRENCY_PATTERNS = [
+    ('SAR', re.compile(r'ريال\s*سعودي|ر\.?\s*س\b|\bsar\b|\bsr\b', re.IGNORECASE)),
+    ('USD', re.compile(r'دولار|\$|\busd\b|\bdollars?\b', re.IGNORECASE)),
+    ('YER', re.compile(r'ريال|ر\.?\s*ي\b|\byer\b|\byr\b|\brials?\b', re.IGNORECASE)),
+]
+
+# الأرقام الهندية العربية والفارسية
+_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+
+_NUMBER_RE = re.compile(
+    r'(\d+(?:[.,٬٫]\d+)*)\s*(مليون|ملايين|الف|ألف|آلاف|الاف|k\b|m\b)?',
+    re.IGNORECASE
+)
+_MULTIPLIERS = {'مليون': 1_000_000, 'ملايين': 1_000_000, 'm': 1_000_000,
+                'الف': 1_000, 'ألف': 1_000, 'آلاف': 1_000, 'الاف': 1_000, 'k': 1_000}
+
+_FROM_RE = re.compile(r'^\s*(من|ابتداء|يبدأ|starting|from)', re.IGNORECASE)
+_UP_TO_RE = re.compile(r'^\s*(حتى|إلى|الى|لغاية|up\s*to|max)', re.IGNORECASE)
+
+
+# ما يفصل طرفي النطاق ("500 - 800"، "من 500 إلى 800")
+_RANGE_SEPARATOR_RE = re.compile(r'^(-|–|—|~|إلى|الى|حتى|to)$', re.IGNORECASE)
+
+
+def _to_number(digits, multiplier):
+    """تحويل "500,000" أو "1.5" + "مليون" إلى رقم (بدون تقريب)"""
+    digits = digits.replace('٬', ',').replace('٫', '.')
+    if ',' in digits and '.' in digits:
+        # 1,500.50
+        value = float(digits.replace(',', ''))
+    else:
+        groups = re.split(r'[.,]', digits)
+        if len(groups) > 1 and all(len(group) == 3 for group in groups[1:]):
+            # فاصل آلاف: 500,000 و 500.000 و "1,500 ألف"
+            value = float(''.join(groups))
+        elif len(groups) <= 2:
+            # كسر عشري: 1.5 و "1,5 مليون"
+            value = float('.'.join(groups))
+        else:
+            raise ValueError(digits)
+    if multiplier:
+        value *= _MULTIPLIERS[multiplier.lower()]
+    return value
+
+
+def _is_range(between):
+    """هل النص بين رقمين فاصل نطاق؟ (بعد حذف أسماء العملات: "500 دولار - 800 دولار")"""
+    for _, pattern in _CURRENCY_PATTERNS:
+        between = pattern.sub(' ', between)
+    return bool(_RANGE_SEPARATOR_RE.match(between.strip()))
+
+
+def parse_salary(text):
+    """
+    تحليل نص الراتب إلى (الحد الأدنى, الحد الأعلى, العملة).
+    النصوص غير المحددة ("قابل للتفاوض") تعيد (None, None, None).
+    """
+    if not text:
+        return None, None, None
+
+    text = text.translate(_DIGITS)
+
+    parsed = []
+    for match in _NUMBER_RE.finditer(text):
+        try:
+            value = _to_number(match.group(1), match.group(2))
+        except ValueError:
+            continue
+        if value > 0:
+            parsed.append((value, match.group(2), match))
+
+    if not parsed:
+        # "قابل للتفاوض" وما شابه
+        return None, None, None
+
+    currency = DEFAULT_CURRENCY
+    for code, pattern in _CURRENCY_PATTERNS:
+        if pattern.search(text):
+            currency = code
+            break
+
+    # نطاق فقط إذا كان أول رقمين حول "-" أو "إلى" ("500 دولار + 100 بدل" ليس نطاقاً)
+    if len(parsed) >= 2 and _is_range(text[parsed[0][2].end():parsed[1][2].start()]):
+        low, high = parsed[0][0], parsed[1][0]
+        # "1.5 - 2 مليون": المضاعف الأخير يُطبق على الطرف الأول أيضاً (قبل التقريب)
+        if parsed[1][1] and not parsed[0][1]:
+            low *= _MULTIPLIERS[parsed[1][1].lower()]
+        low, high = int(round(low)), int(round(high))
+        return min(low, high), max(low, high), currency
+
+    value = int(round(parsed[0][0]))
+    if _UP_TO_RE.search(text):
+        return None, value, currency
+    if _FROM_RE.search(text):
+        return value, None, currency
+    return value, value, currency
+
+
+# أمثلة للتحقق من المحلل: python salary.py
+_CHECKS = [
+    ('500,000 - 800,000 ريال', (500000, 800000, 'YER')),
+    ('1.5 - 2 مليون', (1500000, 2000000, 'YER')),
+    ('1,500 ألف', (1500000, 1500000, 'YER')),
+    ('1,5 مليون ريال', (1500000, 1500000, 'YER')),
+    ('500 دولار + 100 بدل', (500, 500, 'USD')),
+    ('500 دولار - 800 دولار', (500, 800, 'USD')),
+    ('من 3000 إلى 5000 ريال سعودي', (3000, 5000, 'SAR')),
+    ('500 - 800 ألف', (500000, 800000, 'YER')),
+    ('حتى 800 دولار', (None, 800, 'USD')),
+    ('يبدأ من 200 ألف', (200000, None, 'YER')),
+    ('٥٠٠٬٠٠٠ ريال', (500000, 500000, 'YER')),
+    ('قابل للتفاوض', (None, None, None)),
+]
+
+if __name__ == '__main__':
+    for text, expected in _CHECKS:
+        result = parse_salary(text)
+        assert result == expected, f'{text!r}: {result} != {expected}'
+    print(f'{len(_CHECKS)} حالة صحيحة')
@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+
+# ==============================
+# 💾 تخزين الملفات المرفوعة (محلي أو S3)
+# ==============================
+#
+# المفاتيح بصيغة "cvs/<name>" أو "videos/<name>" ومساراتها في قاعدة البيانات
+# "/uploads/<key>" كما كانت، والشعارات ونسخها تحت "logos/". الاختيار عبر STORAGE_BACKEND:
+#
+#   local (افتراضي)  مجلد static/uploads على نفس الخادم
+#   s3               أي خدمة متوافقة مع S3 (AWS، Cloudflare R2، MinIO...)
+#                    S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+#
+# للتجربة محلياً بدون حساب سحابي: شغل MinIO (أو moto_server) ثم
+#   STORAGE_BACKEND=s3 S3_BUCKET=uploads S3_ENDPOINT_URL=http://localhost:9000
+#
+# الرفع المباشر (/api/upload/presign) يسجل كل مفتاح في جدول direct_uploads مربوطاً بالوظيفة،
+# والملفات التي لم تُرسل إلى /api/upload خلال المهلة يحذفها (يُشغل دورياً):
+#   flask --app app cleanup-direct-uploads
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class LocalStorage:
+
+    # لا يوجد رفع مباشر: الملفات تمر عبر /api/upload دائماً
+    direct_uploads = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f'invalid storage key: {key}')
+        return path
+
+    def save(self, key, fileobj, content_type=None):
+        """نسخ الملف على دفعات ثم نقله دفعة واحدة حتى لا يظهر ملف ناقص"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(fileobj, out, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key):
+        return self._path(key)
+
+    def download_url(self, key, filename=None):
+        # يتم تقديم الملف من Flask مباشرة
+        return None
+
+    def presigned_upload(self, key, content_type, max_size):
+        return None
+
+
+class S3Storage:
+
+    direct_uploads = True
+
+    def __init__(self, bucket, endpoint_url=None, region=None, url_expiry=3600):
+        # boto3 مطلوب فقط مع هذا الخيار
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.exceptions import ClientError
+
+        self.bucket = bucket
+        self.url_expiry = url_expiry
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self._client_error = ClientError
+        # رفع متعدد الأجزاء على دفعات بدلاً من تحميل الملف كاملاً في الذاكرة
+        self._transfer = TransferConfig(multipart_threshold=8 * 1024 * 1024,
+                                        multipart_chunksize=8 * 1024 * 1024,
+                                        max_concurrency=4)
+
+    def save(self, key, fileobj, content_type=None):
+        extra = {'ContentType': content_type} if content_type else None
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra, Config=self._transfer)
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except self._client_error as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        return head['ContentLength'] if head else None
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def local_path(self, key):
+        return None
+
+    def download_url(self, key, filename=None):
+        """رابط مؤقت للتحميل مباشرة من التخزين بدون المرور عبر Flask"""
+        params = {'Bucket': self.bucket, 'Key': key}
+        if filename:
+            params['ResponseContentDisposition'] = f'inline; filename="{filename}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expiry)
+
+    def presigned_upload(self, key, content_type, max_size):
+        """بيانات رفع مباشر (POST) للتطبيق مع حد أقصى للحجم"""
+        return self.client.generate_presigned_post(
+            self.bucket, key,
+            Fields={'Content-Type': content_type},
+            Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_size]],
+            ExpiresIn=self.url_expiry
+        )
+
+
+def get_storage(backend, local_root):
+    if backend == 's3':
+        return S3Storage(os.environ['S3_BUCKET'],
+                         endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+                         region=os.environ.get('S3_REGION') or None)
+    return LocalStorage(local_root)
@@ -0,0 +1,192 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+
+from locations import LOCATIONS, normalize_arabic, strip_article, governorate_of
+
+# ==============================
+# ⌨️ الإكمال التلقائي لمربع البحث
+# ==============================
+#
+# مصفوفة مرتبة من (بادئة مُوحدة, رقم الاقتراح) لكل بداية كلمة في عناوين الوظائف
+# النشطة وأسماء الشركات والمواقع، فيكون البحث bisect ثم قراءة نطاق متصل بدلاً من
+# LIKE '%x%' مع كل حرف. الترتيب حسب عدد الوظائف النشطة، والنتائج تُخزن مؤقتاً
+# حتى إعادة البناء التالية.
+
+# البادئات القصيرة تطابق معظم الفهرس فتُحسب نتائجها مسبقاً عند البناء
+SHORT_PREFIX = 2
+MAX_LIMIT = 20
+
+
+def _keys_for(text):
+    """النص الموحد وكل لاحقة تبدأ ببداية كلمة (مع وبدون "ال")"""
+    normalized = normalize_arabic(text)
+    words = normalized.split()
+    keys = set()
+    for i in range(len(words)):
+        suffix = ' '.join(words[i:])
+        keys.add(suffix)
+        keys.add(strip_article(suffix))
+    keys.discard('')
+    return keys
+
+
+class SuggestIndex:
+
+    def __init__(self, refresh_seconds=5, cache_size=2048):
+        self._refresh_seconds = refresh_seconds
+        self._cache_size = cache_size
+        self._keys = []
+        self._entries = []
+        self._normalized = []
+        self._short = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._checked_at = 0
+        self.building = False
+        self.version = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invalidate(self):
+        """فحص قاعدة البيانات عند الطلب التالي (بعد إضافة أو إيقاف وظيفة في هذه العملية)"""
+        with self._lock:
+            self._checked_at = 0
+
+    def needs_check(self):
+        return time.monotonic() - self._checked_at >= self._refresh_seconds
+
+    def start_refresh(self):
+        """تسجيل الفحص وحجز البناء - True إذا لم يكن هناك بناء جارٍ في هذه العملية"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self.building:
+                return False
+            self.building = True
+            return True
+
+    def finish_refresh(self):
+        with self._lock:
+            self.building = False
+
+    def build(self, entries, version):
+        """entries: [(النوع, النص المعروض, المعرف, عدد الوظائف, [أسماء بديلة])]"""
+        keys = []
+        for position, (_, text, _, _, aliases) in enumerate(entries):
+            for alias in {text, *aliases}:
+                keys.extend((key, position) for key in _keys_for(alias))
+        keys.sort()
+        normalized = [normalize_arabic(entry[1]) for entry in entries]
+
+        short = defaultdict(set)
+        for key, position in keys:
+            for n in range(1, min(len(key), SHORT_PREFIX) + 1):
+                short[key[:n]].add(position)
+        short = {prefix: _rank(prefix, positions, entries, normalized, MAX_LIMIT)
+                 for prefix, positions in short.items()}
+
+        with self._lock:
+            self._entries = [entry[:4] for entry in entries]
+            self._normalized = normalized
+            self._keys = keys
+            self._short = short
+            self._cache.clear()
+            self.version = version
+
+    def suggest(self, query, limit=8):
+        """أفضل الاقتراحات لبادئة - [(النوع, النص, المعرف, عدد الوظائف)]"""
+        prefix = normalize_arabic(query)
+        limit = min(limit, MAX_LIMIT)
+        if not prefix:
+            return []
+
+        cache_key = (prefix, limit)
+        with self._lock:
+            entries = self._entries
+            if len(prefix) <= SHORT_PREFIX:
+                return [entries[position] for position in self._short.get(prefix, [])[:limit]]
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
+            keys, normalized = self._keys, self._normalized
+
+        matched = set()
+        start = bisect_left(keys, (prefix,))
+        for i in range(start, len(keys)):
+            key, position = keys[i]
+            if not key.startswith(prefix):
+                break
+            matched.add(position)
+
+        results = [entries[position] for position in _rank(prefix, matched, entries, normalized, limit)]
+
+        with self._lock:
+            if keys is self._keys:
+                self._cache[cache_key] = results
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return results
+
+
+def _rank(prefix, positions, entries, normalized, limit):
+    # الأكثر وظائف أولاً، ثم ما يبدأ بالنص المكتوب - أفضل limit فقط بدون ترتيب كل المطابقات
+    return heapq.nsmallest(limit, positions,
+                           key=lambda p: (-entries[p][3], not normalized[p].startswith(prefix), entries[p][1]))
+
+
+def load_entries(conn):
+    """الاقتراحات من الوظائف النشطة: العناوين، الشركات، والمواقع (مع المحافظة الأم)"""
+    entries = []
+
+    # العناوين بعد التوحيد: "محاسب" و"مُحاسب" اقتراح واحد بالصيغة الأكثر استخداماً
+    titles = {}
+    for row in conn.execute('SELECT title, COUNT(*) AS total FROM jobs WHERE is_active = 1 GROUP BY title'):
+        normalized = normalize_arabic(row['title'])
+        if normalized:
+            titles.setdefault(normalized, Counter())[row['title']] += row['total']
+    for variants in titles.values():
+        entries.append(('title', variants.most_common(1)[0][0], None, sum(variants.values()), []))
+
+    for row in conn.execute('''SELECT c.id, c.name, COUNT(*) AS total
+                               FROM jobs j JOIN companies c ON j.company_id = c.id
+                               WHERE j.is_active = 1 GROUP BY c.id'''):
+        entries.append(('company', row['name'], row['id'], row['total'], []))
+
+    counts = Counter()
+    for row in conn.execute('''SELECT location_id, COUNT(*) AS total FROM jobs
+                               WHERE is_active = 1 AND location_id IS NOT NULL GROUP BY location_id'''):
+        counts[row['location_id']] += row['total']
+        if governorate_of(row['location_id']) != row['location_id']:
+            counts[governorate_of(row['location_id'])] += row['total']
+    # كل مواقع الدليل مقترحة حتى بدون وظائف (تأتي في آخر الترتيب)
+    for loc in LOCATIONS.values():
+        entries.append(('location', loc['name'], loc['id'], counts[loc['id']],
+                        [loc['name_en'], *loc['aliases']]))
+
+    return entries
+
+
+def _rebuild(connect, index):
+    conn = connect()
+    try:
+        version = conn.execute("SELECT value FROM sequences WHERE name = 'jobs'").fetchone()[0]
+        if version != index.version:
+            index.build(load_entries(conn), version)
+    finally:
+        conn.close()
+        index.finish_refresh()
+
+
+def refresh_index(connect, index):
+    """إعادة البناء إذا تغيرت الوظائف (من أي عملية). أول بناء ينتظره الطلب، وما بعده
+    يتم في الخلفية مع استمرار الرد من الفهرس الحالي"""
+    if not index.start_refresh():
+        return
+    if index.version is None:
+        _rebuild(connect, index)
+    else:
+        threading.Thread(target=_rebuild, args=(connect, index), name='suggest-rebuild', daemon=True).start()